@@ -0,0 +1,419 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from pydantic import BaseModel, Field
+
+from agent.services.doc_store import DocStore
+from agent.services.local_doc_load import AllLocalDocResults, LocalDocResult
+from agent.services.rag_agent import CHUNK_OVERLAP, CHUNK_SIZE, RELEVANCE_THRESHOLD, TOP_K, map_agent
+
+try:
+    import resource
+except ImportError:  # Windows: memory is reported as None
+    resource = None
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic offline embedder: signed feature hashing of word unigrams and bigrams.
+
+    Relevance scores are on a different scale than OpenAI embeddings, so absolute
+    thresholds found with it do not carry over one to one; relative trends do.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self.seconds = 0.0
+
+    def _embed(self, text: str) -> List[float]:
+        words = re.findall(r"\w+", text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        hashes = np.fromiter((zlib.crc32(f.encode()) for f in features), dtype=np.int64, count=len(features))
+        vec = np.zeros(self.dim)
+        np.add.at(vec, hashes % self.dim, np.where(hashes & 0x80000000, -1.0, 1.0))
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm else vec).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        vectors = [self._embed(t) for t in texts]
+        self.seconds += time.perf_counter() - start
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class LabeledQuery(BaseModel):
+    query: str
+    relevant: List[str] = Field(..., description="Passages; a chunk containing any of them is relevant")
+
+
+class Corpus(BaseModel):
+    source: str = Field(..., description="synthetic, a JSONL path or a document store path")
+    documents: AllLocalDocResults
+    queries: List[LabeledQuery]
+
+
+class CorpusSpec(BaseModel):
+    """How to build the corpus; rebuilt in each worker process instead of being pickled across"""
+
+    docs: int = 200
+    doc_words: int = 1500
+    queries: int = 50
+    needles_per_query: int = 3
+    seed: int = 0
+    corpus_path: Optional[str] = None
+    doc_store_path: Optional[str] = None
+    queries_path: Optional[str] = None
+
+
+def _pseudo_word(rng: random.Random) -> str:
+    return "".join(rng.choice("bcdfghjklmnpqrstvwxz") + rng.choice("aeiou") for _ in range(rng.randint(2, 4)))
+
+
+def synthetic_corpus(spec: CorpusSpec) -> Corpus:
+    """
+    Topic-skewed background text with planted needle paragraphs.
+
+    Each query asks about a set of key words that only appear in its needle paragraph,
+    planted in needles_per_query documents, so every chunk holding it is labeled relevant.
+    """
+    rng = random.Random(spec.seed)
+    vocabulary = list({_pseudo_word(rng) for _ in range(5000)})
+    topics = [rng.sample(vocabulary, 50) for _ in range(20)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]  # Zipf-like word frequencies
+
+    def paragraph(topic: List[str], words: int) -> str:
+        picks = rng.choices(vocabulary, weights=weights, k=words)
+        for i in range(0, words, 4):
+            picks[i] = rng.choice(topic)
+        return " ".join(picks).capitalize() + "."
+
+    bodies: List[List[str]] = []
+    for _ in range(spec.docs):
+        topic = rng.choice(topics)
+        paragraphs, remaining = [], spec.doc_words
+        while remaining > 0:
+            size = min(rng.randint(60, 140), remaining)
+            paragraphs.append(paragraph(topic, size))
+            remaining -= size
+        bodies.append(paragraphs)
+
+    queries = []
+    for q in range(spec.queries):
+        keys = [f"{_pseudo_word(rng)}{q}" for _ in range(6)]
+        needle = f"Key finding {q}: " + " ".join(keys + rng.sample(vocabulary, 6)) + "."
+        for d in rng.sample(range(spec.docs), min(spec.needles_per_query, spec.docs)):
+            bodies[d].insert(rng.randint(0, len(bodies[d])), needle)
+        queries.append(LabeledQuery(query=" ".join(rng.sample(keys, 4)), relevant=[needle]))
+
+    documents = AllLocalDocResults(results=[
+        LocalDocResult(title=f"synthetic-{i}", content="\n\n".join(paragraphs))
+        for i, paragraphs in enumerate(bodies)
+    ])
+    return Corpus(source="synthetic", documents=documents, queries=queries)
+
+
+def _read_jsonl(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_corpus(spec: CorpusSpec) -> Corpus:
+    if spec.corpus_path is None and spec.doc_store_path is None:
+        return synthetic_corpus(spec)
+    if spec.queries_path is None:
+        raise ValueError("A recorded corpus needs --queries-file with labeled relevant passages")
+
+    queries = [LabeledQuery(**row) for row in _read_jsonl(spec.queries_path)]
+    if spec.corpus_path is not None:
+        # One {"title": ..., "content": ...} object per line
+        documents = AllLocalDocResults(results=[LocalDocResult(**row) for row in _read_jsonl(spec.corpus_path)])
+        return Corpus(source=spec.corpus_path, documents=documents, queries=queries)
+
+    # Pages and PDFs recorded by earlier runs; only hashes are held, text is read while indexing
+    documents = AllLocalDocResults(results=[
+        LocalDocResult(title=s.title, content_hash=s.cleaned_hash) for s in DocStore(spec.doc_store_path).sources()
+    ])
+    return Corpus(source=spec.doc_store_path, documents=documents, queries=queries)
+
+
+def _rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def _percentiles(latencies: List[float]) -> Dict[str, float]:
+    ms = np.array(latencies) * 1000
+    return {
+        "p50": float(np.percentile(ms, 50)),
+        "p90": float(np.percentile(ms, 90)),
+        "p99": float(np.percentile(ms, 99)),
+        "mean": float(ms.mean()),
+        "max": float(ms.max()),
+    }
+
+
+def _retrieval_metrics(
+    hits: List[List[Tuple[float, bool]]],
+    relevant_totals: List[int],
+    threshold: float
+) -> Dict[str, Optional[float]]:
+    """Recall, precision, hit rate and result count per query of (score, is_relevant) hits, averaged over queries"""
+    recalls, precisions, found, returned = [], [], 0, 0
+    for total, scored in zip(relevant_totals, hits):
+        kept = [is_relevant for score, is_relevant in scored if score >= threshold]
+        relevant = sum(kept)
+        returned += len(kept)
+        found += relevant > 0
+        if total:
+            recalls.append(relevant / total)
+        if kept:
+            precisions.append(relevant / len(kept))
+    return {
+        "recall": float(np.mean(recalls)) if recalls else None,
+        "precision": float(np.mean(precisions)) if precisions else None,
+        "hit_rate": found / len(hits) if hits else None,
+        "mean_returned": returned / len(hits) if hits else None,
+    }
+
+
+def run_config(
+    spec: CorpusSpec,
+    chunk_size: int,
+    chunk_overlap: int,
+    ks: List[int],
+    thresholds: List[float],
+    repeats: int,
+    dim: int
+) -> List[Dict[str, Any]]:
+    """
+    Index the corpus once with one chunking and measure every k and threshold against it.
+
+    Runs in a fresh process per chunking so peak memory belongs to this configuration alone.
+    """
+    # Signed hashing gives slightly negative cosines for unrelated text; LangChain warns on every such query
+    warnings.filterwarnings("ignore", message="Relevance scores must be between 0 and 1")
+    corpus = load_corpus(spec)
+    store = DocStore(spec.doc_store_path) if spec.doc_store_path else None
+    embedding = HashingEmbeddings(dim)
+    db_path = tempfile.mkdtemp(prefix="rag-bench-")
+    try:
+        rss_before = _rss_mb()
+        start = time.perf_counter()
+        vectorstore = map_agent(
+            corpus.documents, db_path, store=store,
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, embedding=embedding
+        )
+        index_seconds = time.perf_counter() - start
+        if vectorstore is None:
+            raise ValueError("Corpus produced no chunks to index")
+
+        stored = vectorstore.get(include=["documents", "embeddings"])
+        chunks, vectors = stored["documents"], np.asarray(stored["embeddings"], dtype=np.float32)
+        del stored
+        labels = np.array([[any(p in c for p in q.relevant) for c in chunks] for q in corpus.queries], dtype=bool)
+        relevant_totals = labels.sum(axis=1).tolist()
+        corpus_bytes = sum(len(c.encode("utf-8")) for c in chunks)
+        indexing = {
+            "chunks": len(chunks),
+            "index_seconds": index_seconds,
+            "embed_seconds": embedding.seconds,
+            "docs_per_second": len(corpus.documents.results) / index_seconds,
+            "chunks_per_second": len(chunks) / index_seconds,
+            "mb_per_second": corpus_bytes / 1e6 / index_seconds,
+            "rss_mb_before": rss_before,
+            "rss_mb_after": _rss_mb(),
+        }
+        del chunks
+        query_vectors = np.asarray(embedding.embed_documents([q.query for q in corpus.queries]), dtype=np.float32)
+        exact_scores = query_vectors @ vectors.T  # Unit vectors, so this is the cosine relevance Chroma reports
+
+        rows = []
+        for k in ks:
+            vectorstore.similarity_search_with_relevance_scores(corpus.queries[0].query, k=k)  # Warm-up
+            latencies, hits = [], []
+            for _ in range(repeats):
+                for q in corpus.queries:
+                    start = time.perf_counter()
+                    # Same call search_with_threshold makes; thresholds are applied to its scores below
+                    vectorstore.similarity_search_with_relevance_scores(q.query, k=k)
+                    latencies.append(time.perf_counter() - start)
+            for q in corpus.queries:
+                results = vectorstore.similarity_search_with_relevance_scores(q.query, k=k)
+                hits.append([(score, any(p in doc.page_content for p in q.relevant)) for doc, score in results])
+
+            # Brute-force top-k over the same vectors separates chunking/embedder quality from HNSW misses
+            exact_hits = []
+            for scores, label in zip(exact_scores, labels):
+                top = np.argsort(-scores)[:k]
+                exact_hits.append([(float(scores[i]), bool(label[i])) for i in top])
+
+            for threshold in thresholds:
+                metrics = _retrieval_metrics(hits, relevant_totals, threshold)
+                rows.append({
+                    "chunk_size": chunk_size,
+                    "chunk_overlap": chunk_overlap,
+                    "k": k,
+                    "threshold": threshold,
+                    **indexing,
+                    "query_latency_ms": _percentiles(latencies),
+                    **metrics,
+                    "exact_recall": _retrieval_metrics(exact_hits, relevant_totals, threshold)["recall"],
+                    "peak_rss_mb": _peak_rss_mb(),
+                })
+        return rows
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    spec: CorpusSpec,
+    chunk_sizes: List[int],
+    chunk_overlaps: List[int],
+    ks: List[int],
+    thresholds: List[float],
+    repeats: int = 3,
+    dim: int = 384
+) -> Dict[str, Any]:
+    """
+    Sweep retrieval parameters against the Chroma backend and return a JSON-ready report.
+
+    Args:
+        spec: Corpus to build, synthetic or recorded
+        chunk_sizes: Splitter chunk sizes; each chunking is indexed in its own process
+        chunk_overlaps: Splitter overlaps, combined with every chunk size larger than them
+        ks: Number of nearest chunks requested per query
+        thresholds: Relevance score cut-offs applied to the returned chunks
+        repeats: Times every query is run for the latency percentiles
+        dim: Dimension of the hashing embedder
+
+    Returns:
+        Report with run metadata and one result row per parameter combination
+    """
+    configs: List[Tuple[int, int]] = [(cs, co) for cs in chunk_sizes for co in chunk_overlaps if co < cs]
+    corpus = load_corpus(spec)
+    results: List[Dict[str, Any]] = []
+    # A fresh spawned process per chunking keeps peak RSS and Chroma's caches per configuration
+    with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        for chunk_size, chunk_overlap in configs:
+            print(f"Indexing with chunk_size={chunk_size}, chunk_overlap={chunk_overlap}")
+            results.extend(pool.apply(run_config, (spec, chunk_size, chunk_overlap, ks, thresholds, repeats, dim)))
+
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": "chroma",
+        "embedder": {"name": "hashing", "dim": dim},
+        "corpus": {
+            "source": corpus.source,
+            "documents": len(corpus.documents.results),
+            "queries": len(corpus.queries),
+            "synthetic": spec.model_dump(exclude={"corpus_path", "doc_store_path", "queries_path"})
+            if corpus.source == "synthetic" else None,
+        },
+        "production": {
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP,
+            "k": TOP_K,
+            "threshold": RELEVANCE_THRESHOLD,
+        },
+        "repeats": repeats,
+        "results": results,
+    }
+
+
+def _csv(cast):
+    return lambda value: [cast(v) for v in value.split(",") if v]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline retrieval quality vs. latency benchmark for the RAG agent")
+    parser.add_argument("--docs", type=int, default=200, help="Synthetic documents")
+    parser.add_argument("--doc-words", type=int, default=1500, help="Words per synthetic document")
+    parser.add_argument("--queries", type=int, default=50, help="Synthetic labeled queries")
+    parser.add_argument("--needles-per-query", type=int, default=3, help="Documents holding each query's answer")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus", help="Recorded corpus, JSONL of {title, content}")
+    parser.add_argument("--doc-store", help="Recorded corpus from a document store written by earlier runs")
+    parser.add_argument("--queries-file", help="JSONL of {query, relevant: [passages]} for a recorded corpus")
+    parser.add_argument("--chunk-sizes", type=_csv(int), default=[500, 1000, CHUNK_SIZE, 2000])
+    parser.add_argument("--chunk-overlaps", type=_csv(int), default=[0, CHUNK_OVERLAP, 200])
+    parser.add_argument("--ks", type=_csv(int), default=[10, TOP_K])
+    parser.add_argument("--thresholds", type=_csv(float), default=[0.0, 0.1, 0.2, 0.3, RELEVANCE_THRESHOLD])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--dim", type=int, default=384, help="Hashing embedder dimension")
+    parser.add_argument("--output", default="rag_benchmark.json", help="Where the JSON report is written")
+    args = parser.parse_args()
+
+    spec = CorpusSpec(
+        docs=args.docs,
+        doc_words=args.doc_words,
+        queries=args.queries,
+        needles_per_query=args.needles_per_query,
+        seed=args.seed,
+        corpus_path=args.corpus,
+        doc_store_path=args.doc_store,
+        queries_path=args.queries_file
+    )
+    report = run_benchmark(
+        spec, args.chunk_sizes, args.chunk_overlaps, args.ks, args.thresholds,
+        repeats=args.repeats, dim=args.dim
+    )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'size':>6} {'overlap':>7} {'k':>4} {'thresh':>6} {'recall':>6} {'exact':>6} {'prec':>6} {'p50ms':>7} {'p99ms':>7} {'chunks/s':>9} {'peakMB':>7}")
+    for row in report["results"]:
+        recall = f"{row['recall']:.3f}" if row["recall"] is not None else "-"
+        exact = f"{row['exact_recall']:.3f}" if row["exact_recall"] is not None else "-"
+        precision = f"{row['precision']:.3f}" if row["precision"] is not None else "-"
+        peak = f"{row['peak_rss_mb']:.0f}" if row["peak_rss_mb"] is not None else "-"
+        print(
+            f"{row['chunk_size']:>6} {row['chunk_overlap']:>7} {row['k']:>4} {row['threshold']:>6.2f} {recall:>6} {exact:>6} "
+            f"{precision:>6} {row['query_latency_ms']['p50']:>7.2f} {row['query_latency_ms']['p99']:>7.2f} "
+            f"{row['chunks_per_second']:>9.0f} {peak:>7}"
+        )
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import functools
+import time
+from typing import Any, Callable, List, Mapping, Optional
+from langchain_core.callbacks import UsageMetadataCallbackHandler
+from llm_model import estimate_tokens
+from agent.services.resilience import call_deadline
+
+# Share of the run's deadline kept back for retrieval, synthesis and content generation once
+# crawling stops, up to SYNTHESIS_RESERVE_SECONDS
+SYNTHESIS_RESERVE_SHARE = 0.4
+SYNTHESIS_RESERVE_SECONDS = 90.0
+
+# Share of the token budget that LLM cleanup of crawled pages may use
+CLEANUP_TOKEN_SHARE = 0.4
+
+# Share of the remaining tokens that retrieved chunks may take up in the synthesis prompt
+CONTEXT_TOKEN_SHARE = 0.5
+
+# Below either limit, insights are not synthesized by a separate LLM call and
+# content is generated in a single shot from the top retrieved chunks
+TWO_STAGE_MIN_SECONDS = 60.0
+TWO_STAGE_MIN_TOKENS = 20_000
+
+
+def time_left(state: Mapping[str, Any]) -> Optional[float]:
+    """Seconds until the run's deadline, None if the run has no deadline"""
+    deadline = state.get("deadline")
+    return None if deadline is None else deadline - time.time()
+
+
+def tokens_left(state: Mapping[str, Any]) -> Optional[int]:
+    """LLM tokens left in the run's budget, None if the run is unbudgeted"""
+    budget = state.get("token_budget")
+    return None if budget is None else budget - state.get("tokens_used", 0)
+
+
+def crawl_stop_at(state: Mapping[str, Any]) -> Optional[float]:
+    deadline = state.get("deadline")
+    if deadline is None:
+        return None
+    duration = deadline - state.get("started_at", deadline - SYNTHESIS_RESERVE_SECONDS)
+    return deadline - min(SYNTHESIS_RESERVE_SECONDS, SYNTHESIS_RESERVE_SHARE * duration)
+
+
+def deadline_bound(node: Callable[[Any], dict]) -> Callable[[Any], dict]:
+    """Wrap a graph node so its external calls, retries and backoff included, cannot run past the run's deadline"""
+    @functools.wraps(node)
+    def bound(state: Any) -> dict:
+        with call_deadline(state.get("deadline")):
+            return node(state)
+    return bound
+
+
+def cleanup_token_limit(state: Mapping[str, Any]) -> Optional[int]:
+    budget = state.get("token_budget")
+    return None if budget is None else int(budget * CLEANUP_TOKEN_SHARE)
+
+
+def use_single_shot(state: Mapping[str, Any]) -> bool:
+    seconds, tokens = time_left(state), tokens_left(state)
+    return (seconds is not None and seconds < TWO_STAGE_MIN_SECONDS) or (
+        tokens is not None and tokens < TWO_STAGE_MIN_TOKENS
+    )
+
+
+def truncate_to_tokens(texts: List[str], limit: int) -> List[str]:
+    """Keep texts in order until their estimated token count would exceed limit"""
+    kept, used = [], 0
+    for text in texts:
+        cost = estimate_tokens(text)
+        if used + cost > limit:
+            break
+        kept.append(text)
+        used += cost
+    return kept
+
+
+def used_tokens(cb: UsageMetadataCallbackHandler) -> int:
+    """Total tokens recorded by a usage handler, across all models"""
+    return sum(usage.get("total_tokens", 0) for usage in cb.usage_metadata.values())
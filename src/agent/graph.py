@@ -1,16 +1,37 @@
-from typing import TypedDict, Optional, List, Annotated
+from typing import TypedDict, Optional, List, Dict, Annotated
+from langchain_core.callbacks import UsageMetadataCallbackHandler
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
 from langgraph.graph.state import CompiledStateGraph
+import contextvars
 import operator
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from agent.services.search_agent import google_search, AllSearchResults
 from agent.services.search_doc_load import text_loader, AllSearchDocResults
 from agent.services.local_doc_load import extract_text_from_pdf, AllLocalDocResults
-from agent.services.rag_agent import reduce_agent, RagResult
-from agent.services.insights_extract import insights_agent, AllStrategicInsights
+from agent.services.rag_agent import init_vector_store, map_agent, reset_vector_store, retrieve_agent, RagResult
+from agent.services.insights_extract import insights_agent, chunk_insights, AllStrategicInsights
 from agent.services.content_generation import marketing_content_agent, AllMarketingContents
 from agent.services.auto_publish import distributor_agent, FacebookPostRequest, DistributorOutput
+from agent.services.doc_store import get_doc_store
+from agent.services.content_index import content_text, dedup_agent, get_content_index, DedupPolicy, DedupReport
 from agent.services.auto_analysis_report import analytics_agent, AnalyticsReport
+from agent.review_queue import ReviewItem, ReviewQueue
+from agent.job_queue import keep_lease
+from llm_model import StructuredCallStats, collect_structured_stats, merge_structured_stats, usage_config
+from agent.budget import (
+    CONTEXT_TOKEN_SHARE,
+    cleanup_token_limit,
+    crawl_stop_at,
+    deadline_bound,
+    time_left,
+    tokens_left,
+    truncate_to_tokens,
+    use_single_shot,
+    used_tokens,
+)
 
 
 class MarketingState(TypedDict):
@@ -22,6 +43,9 @@ class MarketingState(TypedDict):
     facebook_page_id: Optional[str]
     facebook_access_token: Optional[str]
     db_path: str  # Vector store path
+    doc_store_path: Optional[str]  # On-disk store of crawled and extracted text, None to keep text in memory only
+    content_index_path: str  # Index of previously published posts
+    dedup_policy: Optional[DedupPolicy]
     
     # Intermediate results
     search_results: Optional[AllSearchResults]
@@ -30,6 +54,7 @@ class MarketingState(TypedDict):
     rag_results: Optional[RagResult]
     strategic_insights: Optional[AllStrategicInsights]
     marketing_contents: Optional[AllMarketingContents]
+    dedup_report: Optional[DedupReport]
     publish_results: Optional[DistributorOutput]
     analytics_report: Optional[AnalyticsReport]
     
@@ -40,208 +65,306 @@ class MarketingState(TypedDict):
     require_human_approval: bool
     
     # Human-in-the-loop
-    human_approval: Optional[str]  # "approved", "rejected", or None
+    human_approval: Optional[str]  # "pending" (queued for review), "approved", "rejected", or None
     human_feedback: Optional[str]  # Optional feedback from human reviewer
+    review_queue_path: str  # SQLite queue where content waits for a reviewer
+    review_id: Optional[str]
+    job_id: Optional[str]  # Worker job the run belongs to, if any
+    
+    # Deadline and budget
+    started_at: float
+    deadline: Optional[float]  # Absolute wall-clock deadline (time.time()), None for no SLA
+    token_budget: Optional[int]  # Max LLM tokens for the run, None for unlimited
+    tokens_used: Annotated[int, operator.add]
+    degradations: Annotated[List[str], operator.add]  # What was cut back to meet the deadline/budget
+    elapsed_seconds: Optional[float]
+    
+    # Structured-output counters of this run by model, to compare repair rates and costs
+    structured_stats: Annotated[Dict[str, StructuredCallStats], merge_structured_stats]
     
     # Error tracking
     errors: Annotated[List[str], operator.add]
 
 
-def search_node(state: MarketingState) -> MarketingState:
+class WebResearchInput(TypedDict):
+    """Inputs the web research branch reads from MarketingState"""
+
+    query: str
+    db_path: str
+    doc_store_path: Optional[str]
+    started_at: float
+    deadline: Optional[float]
+    token_budget: Optional[int]
+
+
+class WebResearchOutput(TypedDict):
+    """Keys the web research branch writes back to MarketingState"""
+
+    search_results: Optional[AllSearchResults]
+    web_documents: Optional[AllSearchDocResults]
+    tokens_used: Annotated[int, operator.add]
+    degradations: Annotated[List[str], operator.add]
+    errors: Annotated[List[str], operator.add]
+
+
+class WebResearchState(WebResearchInput, WebResearchOutput):
+    """State of the search -> crawl branch, run as a subgraph alongside local_loader"""
+
+
+def vector_store_node(state: MarketingState) -> dict:
+    """Node 0: Reset the vector store so both loader branches can index into it as documents arrive"""
+    try:
+        db_path = state.get("db_path", "./chroma_db")
+        reset_vector_store(db_path)
+        init_vector_store(db_path)
+    except Exception as e:
+        error_msg = f"Vector store error: {str(e)}"
+        print(f"there is some error: {error_msg}")
+        return {"errors": [error_msg]}
+    return {}
+
+
+def search_node(state: WebResearchState) -> dict:
     """Node 1: Use Google PersAPI to find more professional news or articles related to the query"""
     try:
         results = google_search(state["query"])
-        state["search_results"] = results
         print(f"search results length: {len(results.results)}")
+        return {"search_results": results}
     except Exception as e:
         error_msg = f"Search node error: {str(e)}"
         print(f"there is some error: {error_msg}")
-        state["errors"] = state.get("errors", []) + [error_msg]
-    return state
+        return {"errors": [error_msg]}
 
 
-def web_loader_node(state: MarketingState) -> MarketingState:
-    """Node 2a: Load text content from links of web search results"""
+def web_loader_node(state: WebResearchState) -> dict:
+    """Node 2a: Load text content from links of web search results and embed each page as it arrives"""
+    db_path = state.get("db_path", "./chroma_db")
+    # Counts the cleanup calls of this node only; LLM calls made inside the runnable report to it
+    cb = UsageMetadataCallbackHandler()
     try:
         if state.get("search_results") and state["search_results"].results:
-            docs = text_loader(state["search_results"])
-            state["web_documents"] = docs
+            store = get_doc_store(state["doc_store_path"]) if state.get("doc_store_path") else None
+            # Embed on a background worker so the next link is crawled while the previous one is indexed
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                pending = []
+                load = RunnableLambda(lambda search_results: text_loader(
+                    search_results,
+                    on_document=lambda doc: pending.append(
+                        executor.submit(
+                            contextvars.copy_context().run, map_agent, AllSearchDocResults(results=[doc]), db_path, store
+                        )
+                    ),
+                    stop_at=crawl_stop_at(state),
+                    cleanup_token_limit=cleanup_token_limit(state),
+                    store=store
+                ), name="text_loader")
+                docs = load.invoke(state["search_results"], config=usage_config(cb))
+                for future in pending:
+                    future.result()
             print(f"web documents length: {len(docs.results)}")
+
+            degradations = []
+            total_links = len(state["search_results"].results)
+            attempted = len(docs.results) + len(docs.failed_links)
+            if attempted < total_links:
+                degradations.append(f"web_loader: crawled {attempted}/{total_links} links before the deadline")
+            uncleaned = sum(1 for d in docs.results if not d.llm_cleaned)
+            if uncleaned:
+                degradations.append(f"web_loader: skipped LLM cleanup for {uncleaned} page(s) to stay within the token budget")
+            errors = [f"Web loader skipped {link}" for link in docs.failed_links]
+            return {"web_documents": docs, "tokens_used": used_tokens(cb), "degradations": degradations, "errors": errors}
         else:
-            state["web_documents"] = AllSearchDocResults()
             print("No search results to load, pls double check the search node")
+            return {"web_documents": AllSearchDocResults()}
     except Exception as e:
         error_msg = f"Web loader error: {str(e)}"
         print(f"there is some error: {error_msg}")
-        state["errors"] = state.get("errors", []) + [error_msg]
-        state["web_documents"] = AllSearchDocResults()
-    return state
+        return {"web_documents": AllSearchDocResults(), "tokens_used": used_tokens(cb), "errors": [error_msg]}
 
 
-def local_loader_node(state: MarketingState) -> MarketingState:
-    """Node 2b: Load content from local PDF professional documents, such as yearly reports"""
+def local_loader_node(state: MarketingState) -> dict:
+    """Node 2b: Load and embed content from local PDF professional documents, such as yearly reports"""
     if state.get("skip_local_docs", False) or not state.get("local_pdf_path"):
-        state["local_documents"] = AllLocalDocResults()
-        return state
+        return {"local_documents": AllLocalDocResults()}
     
     try:
-        docs = extract_text_from_pdf(state["local_pdf_path"])
-        state["local_documents"] = docs
+        store = get_doc_store(state["doc_store_path"]) if state.get("doc_store_path") else None
+        docs = extract_text_from_pdf(state["local_pdf_path"], store=store)
+        map_agent(docs, state.get("db_path", "./chroma_db"), store=store)
         print(f"local documents length: {len(docs.results)} ")
+        return {"local_documents": docs}
     except Exception as e:
         error_msg = f"Local loader error: {str(e)}"
         print(f"there is some error: {error_msg}")
-        state["errors"] = state.get("errors", []) + [error_msg]
-        state["local_documents"] = AllLocalDocResults()
-    return state
+        return {"local_documents": AllLocalDocResults(), "errors": [error_msg]}
 
 
-def rag_node(state: MarketingState) -> MarketingState:
-    """Node 3: Create vector store and retrieve relevant content"""
+def rag_node(state: MarketingState) -> dict:
+    """Node 3: Retrieve relevant content from the vector store filled by the loader branches"""
     try:
         web_docs = state.get("web_documents") or AllSearchDocResults()
         local_docs = state.get("local_documents") or AllLocalDocResults()
         db_path = state.get("db_path", "./chroma_db")
+
+        if not web_docs.results and not local_docs.results:
+            print("No documents were indexed, skipping retrieval")
+            return {"rag_results": RagResult(content=[])}
         
-        rag_results = reduce_agent(web_docs, local_docs, db_path)
-        state["rag_results"] = rag_results
+        rag_results = retrieve_agent(state["query"], db_path)
         print(f"rag results length: {len(rag_results.content)}")
+
+        # Truncate retrieval so the synthesis prompt leaves room in the token budget
+        degradations = []
+        remaining = tokens_left(state)
+        if remaining is not None:
+            kept = truncate_to_tokens(rag_results.content, int(max(remaining, 0) * CONTEXT_TOKEN_SHARE))
+            if len(kept) < len(rag_results.content):
+                degradations.append(f"rag: kept {len(kept)}/{len(rag_results.content)} retrieved chunks to fit the token budget")
+                rag_results = RagResult(content=kept)
+        return {"rag_results": rag_results, "degradations": degradations}
     except Exception as e:
         error_msg = f"RAG node error: {str(e)}"
         print(f"there is some error: {error_msg}")
-        state["errors"] = state.get("errors", []) + [error_msg]
-        state["rag_results"] = RagResult(content=[])
-    return state
+        return {"rag_results": RagResult(content=[]), "errors": [error_msg]}
 
 
-def insights_node(state: MarketingState) -> MarketingState:
+def insights_node(state: MarketingState) -> dict:
     """Node 4: Extract and synthesize strategic insights"""
-    try:
-        if state.get("rag_results") and state["rag_results"].content:
-            insights = insights_agent(state["rag_results"])
-            state["strategic_insights"] = insights
+    if not (state.get("rag_results") and state["rag_results"].content):
+        print("No RAG results available for insights extraction")
+        return {"strategic_insights": None}
+
+    # Short on time or tokens: skip the synthesis call and generate content single-shot from the chunks
+    if use_single_shot(state):
+        insights = chunk_insights(state["rag_results"])
+        print(f"strategic insights length: {len(insights.insights)} (single-shot)")
+        return {
+            "strategic_insights": insights,
+            "degradations": ["insights: skipped LLM synthesis, content generated single-shot from top retrieved chunks"]
+        }
+
+    cb = UsageMetadataCallbackHandler()
+    with collect_structured_stats() as stats:
+        try:
+            insights = RunnableLambda(insights_agent).invoke(state["rag_results"], config=usage_config(cb))
             print(f"strategic insights length: {len(insights.insights)}")
-        else:
-            print("No RAG results available for insights extraction")
-            state["strategic_insights"] = None
-    except Exception as e:
-        error_msg = f"Insights node error: {str(e)}"
-        print(f"there is some error: {error_msg}")
-        state["errors"] = state.get("errors", []) + [error_msg]
-    return state
+            return {"strategic_insights": insights, "tokens_used": used_tokens(cb), "structured_stats": stats}
+        except Exception as e:
+            error_msg = f"Insights node error: {str(e)}"
+            print(f"there is some error: {error_msg}")
+            return {"tokens_used": used_tokens(cb), "structured_stats": stats, "errors": [error_msg]}
 
 
-def content_generation_node(state: MarketingState) -> MarketingState:
+def content_generation_node(state: MarketingState) -> dict:
     """Node 5: Generate marketing content"""
-    try:
-        if state.get("strategic_insights"):
-            contents = marketing_content_agent(state["strategic_insights"])
-            state["marketing_contents"] = contents
+    if not state.get("strategic_insights"):
+        print("No insights available for content generation")
+        return {"marketing_contents": None}
+
+    remaining = tokens_left(state)
+    if remaining is not None and remaining <= 0:
+        print("Token budget exhausted, skipping content generation")
+        return {"marketing_contents": None, "degradations": ["content_generation: skipped, token budget exhausted"]}
+
+    cb = UsageMetadataCallbackHandler()
+    with collect_structured_stats() as stats:
+        try:
+            contents = RunnableLambda(marketing_content_agent).invoke(state["strategic_insights"], config=usage_config(cb))
             print(f"marketing contents length: {len(contents.contents)}")
-        else:
-            print("No insights available for content generation")
-            state["marketing_contents"] = None
-    except Exception as e:
-        error_msg = f"Content generation error: {str(e)}"
-        print(f"there is some error: {error_msg}")
-        state["errors"] = state.get("errors", []) + [error_msg]
-    return state
+            return {"marketing_contents": contents, "tokens_used": used_tokens(cb), "structured_stats": stats}
+        except Exception as e:
+            error_msg = f"Content generation error: {str(e)}"
+            print(f"there is some error: {error_msg}")
+            return {"tokens_used": used_tokens(cb), "structured_stats": stats, "errors": [error_msg]}
 
 
-def publishing_node(state: MarketingState) -> MarketingState:
+def publishing_node(state: MarketingState) -> dict:
     """Node 6: Publish content to Facebook"""
     if state.get("skip_publishing", False):
         print("Skipping content publishing")
-        return state
+        return {}
     
     try:
         if not state.get("marketing_contents"):
             print("No marketing content to publish")
-            return state
+            return {}
             
         if not state.get("facebook_page_id") or not state.get("facebook_access_token"):
             print("Facebook credentials not provided, skipping publishing")
-            state["skip_publishing"] = True
-            return state
+            return {"skip_publishing": True}
+        
+        # Check against previously published posts before spending Graph API quota
+        policy = state.get("dedup_policy") or DedupPolicy()
+        index = get_content_index(state.get("content_index_path", "./published_index"))
+        contents, dedup_report = dedup_agent(state["marketing_contents"], index, policy)
+        duplicates = sum(1 for d in dedup_report.decisions if d.is_duplicate)
+        if duplicates:
+            print(f"Found {duplicates} near-duplicate(s) of earlier posts, policy: {policy.action}")
+        if not contents.contents:
+            print("All content duplicates earlier posts, nothing to publish")
+            return {"dedup_report": dedup_report}
         
         request = FacebookPostRequest(
-            marketing_data=state["marketing_contents"],
+            marketing_data=contents,
             page_id=state["facebook_page_id"],
             access_token=state["facebook_access_token"]
         )
         results = distributor_agent(request)
-        state["publish_results"] = results
         
         successful = sum(1 for r in results.results if r.status == "success")
         print(f"Published {successful}/{len(results.results)} posts successfully")
+
+        by_id = {c.insight_id: c for c in contents.contents}
+        for r in results.results:
+            if r.status == "success" and r.post_id and r.content_id in by_id:
+                index.add(r.post_id, content_text(by_id[r.content_id]), use_embeddings=policy.use_embeddings)
+        return {"publish_results": results, "dedup_report": dedup_report}
     except Exception as e:
         error_msg = f"Publishing error: {str(e)}"
         print(f"there is some error: {error_msg}")
-        state["errors"] = state.get("errors", []) + [error_msg]
-    return state
+        return {"errors": [error_msg]}
 
 
-def human_review_node(state: MarketingState) -> MarketingState:
-    """Human-in-the-loop: Review and approve/reject content before publishing"""
-    print("HUMAN REVIEW REQUIRED")
-    
+def human_review_node(state: MarketingState) -> dict:
+    """Human-in-the-loop: Queue content for review and end the run; an approval resumes it at publishing"""
     if not state.get("marketing_contents"):
         print("No marketing content available for review")
-        state["human_approval"] = "rejected"
-        return state
-    
-    # Display content for review
-    print("\nGenerated Marketing Content:")
-    
-    for idx, content in enumerate(state["marketing_contents"].contents, 1):
-        print(f"\n[Content #{idx}]")
-        print(f"  Format: {content.content_format}")
-        print(f"  Headline: {content.headline}")
-        print(f"  Target Audience: {content.target_audience}")
-        print(f"  Channels: {', '.join(content.distribution_channel)}")
-        print(f"  Body: {content.body_text[:200]}...")
-        print(f"  CTA: {content.call_to_action}")
-        print("-" * 10)
-    
-    # Request human input
-    print("\n Please review the content above.")
-    print("Options:")
-    print("  1. Type 'approve' or 'yes' to publish")
-    print("  2. Type 'reject' or 'no' to skip publishing")
-    print("  3. Add feedback after your choice (optional)")
-    
+        return {"human_approval": "rejected"}
+
+    # Everything publishing and analytics read, so the run can resume without the earlier nodes;
+    # the access token is left out, reviewers open this queue and it is passed in again on resume
+    dedup_policy = state.get("dedup_policy")
+    resume_state = {
+        "facebook_page_id": state.get("facebook_page_id"),
+        "db_path": state["db_path"],
+        "content_index_path": state.get("content_index_path", "./published_index"),
+        "dedup_policy": dedup_policy.model_dump() if dedup_policy else None,
+        "skip_publishing": state.get("skip_publishing", False),
+        "skip_analytics": state.get("skip_analytics", False),
+    }
+
     try:
-        user_input = input("\nYour decision: ").strip().lower()
-        
-        if user_input in ["approve", "approved", "yes", "y"]:
-            state["human_approval"] = "approved"
-            print("Content approved for publishing!")
-        elif user_input in ["reject", "rejected", "no", "n"]:
-            state["human_approval"] = "rejected"
-            print("Content rejected. Publishing will be skipped.")
-        else:
-            # Allow for feedback with decision
-            if "approve" in user_input or "yes" in user_input:
-                state["human_approval"] = "approved"
-                state["human_feedback"] = user_input
-                print("Content approved with feedback!")
-            else:
-                state["human_approval"] = "rejected"
-                state["human_feedback"] = user_input
-                print("Content rejected with feedback.")
-        
-        # Optional: Get additional feedback
-        if state.get("human_approval") and not state.get("human_feedback"):
-            feedback = input("\nOptional feedback (press Enter to skip): ").strip()
-            if feedback:
-                state["human_feedback"] = feedback
-                
+        review_queue_path = state.get("review_queue_path", "./reviews.sqlite")
+        review_id = ReviewQueue(review_queue_path).submit(
+            query=state["query"],
+            contents=state["marketing_contents"],
+            resume_state=resume_state,
+            job_id=state.get("job_id")
+        )
     except Exception as e:
-        print(f"There is some error getting human input: {e}")
+        error_msg = f"Human review error: {str(e)}"
+        print(f"There is some error queuing content for review: {error_msg}")
         print("Defaulting to rejection for safety.")
-        state["human_approval"] = "rejected"
-    
-    return state
+        return {"human_approval": "rejected", "errors": [error_msg]}
+
+    print(f"HUMAN REVIEW REQUIRED: {len(state['marketing_contents'].contents)} content(s) queued as {review_id}")
+    print(f"  Inspect: python -m agent.review_queue --queue {review_queue_path} show {review_id}")
+    print(f"  Decide:  python -m agent.review_queue --queue {review_queue_path} approve|reject {review_id} [--feedback ...]")
+    if state.get("job_id"):
+        print("  Approved reviews are published by the worker")
+    else:
+        print(f"  Publish: python -m agent.review_queue --queue {review_queue_path} publish {review_id} --facebook-access-token <token>")
+    return {"human_approval": "pending", "review_id": review_id}
 
 
 def check_approval(state: MarketingState) -> str:
@@ -254,16 +377,21 @@ def check_approval(state: MarketingState) -> str:
         return "end"
 
 
-def analytics_node(state: MarketingState) -> MarketingState:
+def analytics_node(state: MarketingState) -> dict:
     """Node 7: Analyze post performance"""
     if state.get("skip_analytics", False):
         print("Skipping analytics")
-        return state
+        return {}
+
+    remaining = time_left(state)
+    if remaining is not None and remaining <= 0:
+        print("Deadline passed, skipping analytics")
+        return {"degradations": ["analytics: skipped, deadline passed"]}
     
     try:
         if not state.get("publish_results"):
             print("No published posts to analyze")
-            return state
+            return {}
         
         post_ids = [
             r.post_id for r in state["publish_results"].results 
@@ -272,51 +400,78 @@ def analytics_node(state: MarketingState) -> MarketingState:
         
         if not post_ids:
             print("No successful posts to analyze")
-            return state
+            return {}
         
         if not state.get("facebook_access_token"):
             print("Facebook access token not provided, skipping analytics")
-            return state
+            return {}
         
         report = analytics_agent(post_ids, state["facebook_access_token"])
-        state["analytics_report"] = report
         print(f"Generated analytics report for {len(report.summary_report)} posts")
         print(f"Average CTR: {report.total_avg_ctr:.2%}")
         if report.top_performing_post_id:
             print(f"Top post: {report.top_performing_post_id}")
+        return {"analytics_report": report}
     except Exception as e:
         error_msg = f"Analytics error: {str(e)}"
         print(f"There is some analytics error: {error_msg}")
-        state["errors"] = state.get("errors", []) + [error_msg]
-    return state
+        return {"errors": [error_msg]}
+
+def create_web_research_graph() -> CompiledStateGraph:
+    """
+    Constructs the search -> crawl branch as a subgraph.
+
+    Running it as a single node of the parent graph lets it overlap with
+    local_loader instead of waiting on it between supersteps.
+
+    Returns:
+        CompiledStateGraph: Web research branch reading query/db_path and
+        writing search_results/web_documents/errors
+    """
+    workflow = StateGraph(
+        WebResearchState,
+        input_schema=WebResearchInput,
+        output_schema=WebResearchOutput
+    )
+
+    workflow.add_node("search", deadline_bound(search_node))
+    workflow.add_node("web_loader", deadline_bound(web_loader_node))
+
+    workflow.set_entry_point("search")
+    workflow.add_edge("search", "web_loader")
+    workflow.add_edge("web_loader", END)
+
+    return workflow.compile()
 
 def create_graph(require_human_approval: bool = False) -> CompiledStateGraph:
     """
     Constructs and compiles the multi-agent marketing intelligence graph.
     
     Args:
-        require_human_approval: If True, adds human-in-the-loop before publishing
+        require_human_approval: If True, queues content for human review instead of publishing
     
     Returns:
         CompiledStateGraph: Ready-to-execute workflow
     """
     workflow = StateGraph(MarketingState)
     
-    workflow.add_node("search", search_node)
-    workflow.add_node("web_loader", web_loader_node)
-    workflow.add_node("local_loader", local_loader_node)
-    workflow.add_node("rag", rag_node)
-    workflow.add_node("insights", insights_node)
-    workflow.add_node("content_generation", content_generation_node)
+    workflow.add_node("vector_store", vector_store_node)
+    workflow.add_node("web_research", create_web_research_graph())
+    workflow.add_node("local_loader", deadline_bound(local_loader_node))
+    workflow.add_node("rag", deadline_bound(rag_node))
+    workflow.add_node("insights", deadline_bound(insights_node))
+    workflow.add_node("content_generation", deadline_bound(content_generation_node))
     workflow.add_node("human_review", human_review_node)
+    # Publishing is not cut off mid-call: an abandoned post may still go out, and is never retried
     workflow.add_node("publishing", publishing_node)
-    workflow.add_node("analytics", analytics_node)
+    workflow.add_node("analytics", deadline_bound(analytics_node))
     
-    workflow.set_entry_point("search")
-    workflow.add_edge("search", "web_loader")
-    workflow.add_edge("search", "local_loader")
-    workflow.add_edge("web_loader", "rag")
-    workflow.add_edge("local_loader", "rag")
+    # Fan out: web research and local PDF loading run concurrently, each
+    # embedding its documents as they arrive; rag only joins and queries
+    workflow.set_entry_point("vector_store")
+    workflow.add_edge("vector_store", "web_research")
+    workflow.add_edge("vector_store", "local_loader")
+    workflow.add_edge(["web_research", "local_loader"], "rag")
     workflow.add_edge("rag", "insights")
     workflow.add_edge("insights", "content_generation")
     
@@ -338,48 +493,69 @@ def create_graph(require_human_approval: bool = False) -> CompiledStateGraph:
     
     return workflow.compile()
 
+def create_publish_graph() -> CompiledStateGraph:
+    """
+    Tail of the marketing graph that an approved review resumes at.
+    
+    Returns:
+        CompiledStateGraph: publishing -> analytics
+    """
+    workflow = StateGraph(MarketingState)
+    
+    workflow.add_node("publishing", publishing_node)
+    workflow.add_node("analytics", analytics_node)
+    
+    workflow.set_entry_point("publishing")
+    workflow.add_edge("publishing", "analytics")
+    workflow.add_edge("analytics", END)
+    
+    return workflow.compile()
+
 graph = create_graph(require_human_approval=False)
 
-def run_marketing_pipeline(
+def build_initial_state(
     query: str,
     local_pdf_path: Optional[str] = None,
     facebook_page_id: Optional[str] = None,
     facebook_access_token: Optional[str] = None,
     db_path: str = "./chroma_db",
+    doc_store_path: Optional[str] = "./doc_store",
+    content_index_path: str = "./published_index",
+    dedup_policy: Optional[DedupPolicy] = None,
     skip_publishing: bool = False,
     skip_analytics: bool = False,
-    require_human_approval: bool = False
+    require_human_approval: bool = False,
+    deadline_seconds: Optional[float] = None,
+    token_budget: Optional[int] = None,
+    review_queue_path: str = "./reviews.sqlite",
+    job_id: Optional[str] = None
 ) -> MarketingState:
     """
-    Execute the complete marketing intelligence pipeline.
+    Build the initial MarketingState for one pipeline run.
     
     Args:
-        query: Search query for finding relevant news
-        local_pdf_path: Optional path to local PDF for additional context
-        facebook_page_id: Facebook Page ID for publishing
-        facebook_access_token: Facebook access token
-        db_path: Path for vector store persistence
-        skip_publishing: Skip the publishing step
-        skip_analytics: Skip the analytics step
-        require_human_approval: If True, pauses for human review before publishing
+        Same as run_marketing_pipeline
     
     Returns:
-        Final state containing all results
+        MarketingState with all intermediate results unset
     """
-    execution_graph = create_graph(require_human_approval=require_human_approval)
-    
-    initial_state: MarketingState = {
+    started_at = time.time()
+    return {
         "query": query,
         "local_pdf_path": local_pdf_path,
         "facebook_page_id": facebook_page_id,
         "facebook_access_token": facebook_access_token,
         "db_path": db_path,
+        "doc_store_path": doc_store_path,
+        "content_index_path": content_index_path,
+        "dedup_policy": dedup_policy,
         "search_results": None,
         "web_documents": None,
         "local_documents": None,
         "rag_results": None,
         "strategic_insights": None,
         "marketing_contents": None,
+        "dedup_report": None,
         "publish_results": None,
         "analytics_report": None,
         "skip_local_docs": local_pdf_path is None,
@@ -388,8 +564,78 @@ def run_marketing_pipeline(
         "require_human_approval": require_human_approval,
         "human_approval": None,
         "human_feedback": None,
+        "review_queue_path": review_queue_path,
+        "review_id": None,
+        "job_id": job_id,
+        "started_at": started_at,
+        "deadline": started_at + deadline_seconds if deadline_seconds is not None else None,
+        "token_budget": token_budget,
+        "tokens_used": 0,
+        "degradations": [],
+        "elapsed_seconds": None,
+        "structured_stats": {},
         "errors": []
     }
+
+def run_marketing_pipeline(
+    query: str,
+    local_pdf_path: Optional[str] = None,
+    facebook_page_id: Optional[str] = None,
+    facebook_access_token: Optional[str] = None,
+    db_path: str = "./chroma_db",
+    doc_store_path: Optional[str] = "./doc_store",
+    content_index_path: str = "./published_index",
+    dedup_policy: Optional[DedupPolicy] = None,
+    skip_publishing: bool = False,
+    skip_analytics: bool = False,
+    require_human_approval: bool = False,
+    deadline_seconds: Optional[float] = None,
+    token_budget: Optional[int] = None,
+    review_queue_path: str = "./reviews.sqlite"
+) -> MarketingState:
+    """
+    Execute the complete marketing intelligence pipeline.
+    
+    Args:
+        query: Search query for finding relevant news
+        local_pdf_path: Optional path to local PDF for additional context
+        facebook_page_id: Facebook Page ID for publishing
+        facebook_access_token: Facebook access token
+        db_path: Path for vector store persistence
+        doc_store_path: Path of the on-disk store of crawled and extracted text, reused across runs;
+            None keeps document text in memory only
+        content_index_path: Path of the index of previously published posts
+        dedup_policy: How near-duplicates of earlier posts are handled, defaults to skipping them
+        skip_publishing: Skip the publishing step
+        skip_analytics: Skip the analytics step
+        require_human_approval: If True, queues content for human review instead of publishing;
+            an approval later resumes the run at publishing (see resume_review)
+        deadline_seconds: Wall-clock SLA for the run; nodes cut back work to meet it
+        token_budget: Max LLM tokens for the run; nodes cut back work to stay within it
+        review_queue_path: SQLite queue where content waits for a reviewer
+    
+    Returns:
+        Final state containing all results, plus what was cut back (degradations),
+        tokens_used, structured_stats and elapsed_seconds
+    """
+    execution_graph = create_graph(require_human_approval=require_human_approval)
+    
+    initial_state = build_initial_state(
+        query=query,
+        local_pdf_path=local_pdf_path,
+        facebook_page_id=facebook_page_id,
+        facebook_access_token=facebook_access_token,
+        db_path=db_path,
+        doc_store_path=doc_store_path,
+        content_index_path=content_index_path,
+        dedup_policy=dedup_policy,
+        skip_publishing=skip_publishing,
+        skip_analytics=skip_analytics,
+        require_human_approval=require_human_approval,
+        deadline_seconds=deadline_seconds,
+        token_budget=token_budget,
+        review_queue_path=review_queue_path
+    )
     
     print("Starting Multi-Agent Marketing Pipeline")
     if require_human_approval:
@@ -397,8 +643,17 @@ def run_marketing_pipeline(
     print("=" * 10)
     
     final_state = execution_graph.invoke(initial_state)
+    final_state["elapsed_seconds"] = time.time() - final_state["started_at"]
     
     print("=" * 10)
+    print(f"Used {final_state['elapsed_seconds']:.1f}s and {final_state['tokens_used']} LLM tokens")
+    for degradation in final_state.get("degradations", []):
+        print(f"Cut back to meet deadline/budget: {degradation}")
+    for model, stats in final_state.get("structured_stats", {}).items():
+        print(
+            f"Structured output from {model}: {stats.calls} call(s), {stats.failure_rate:.0%} needed repair, "
+            f"{stats.repair_requests} repair request(s) costing {stats.repair_tokens} tokens"
+        )
     if final_state.get("errors"):
         print(f"Pipeline completed with {len(final_state['errors'])} error(s)")
         for error in final_state["errors"]:
@@ -408,6 +663,99 @@ def run_marketing_pipeline(
     
     return final_state
 
+def build_resume_state(
+    item: ReviewItem,
+    review_queue_path: str = "./reviews.sqlite",
+    facebook_access_token: Optional[str] = None
+) -> MarketingState:
+    """
+    Rebuild the state an approved review resumes at publishing with.
+    
+    Args:
+        item: Approved review from the review queue
+        review_queue_path: SQLite queue the review came from
+        facebook_access_token: Facebook access token, which is not kept in the review queue
+    
+    Returns:
+        MarketingState with the reviewed content and the approval filled in
+    """
+    saved = item.resume_state
+    state = build_initial_state(
+        query=item.query,
+        facebook_page_id=saved.get("facebook_page_id"),
+        facebook_access_token=facebook_access_token,
+        db_path=saved["db_path"],
+        content_index_path=saved["content_index_path"],
+        dedup_policy=DedupPolicy(**saved["dedup_policy"]) if saved.get("dedup_policy") else None,
+        skip_publishing=saved.get("skip_publishing", False),
+        skip_analytics=saved.get("skip_analytics", False),
+        require_human_approval=True,
+        review_queue_path=review_queue_path,
+        job_id=item.job_id
+    )
+    # Deadline and budget are not carried over: the review may come hours later
+    state.update(
+        marketing_contents=item.contents,
+        human_approval="approved",
+        human_feedback=item.feedback,
+        review_id=item.review_id
+    )
+    return state
+
+def review_outcome(item: ReviewItem, final_state: MarketingState) -> str:
+    """
+    Final review status after publishing resumed.
+    
+    Returns:
+        published if at least one post went out, closed if there was deliberately nothing to post
+        (publishing skipped, or every content duplicated an earlier post), failed otherwise
+    """
+    results = final_state.get("publish_results")
+    if results and any(r.status == "success" for r in results.results):
+        return "published"
+    if results is None and not final_state.get("errors"):
+        if item.resume_state.get("skip_publishing") or final_state.get("dedup_report") is not None:
+            return "closed"
+    return "failed"
+
+def resume_review(
+    review_id: str,
+    review_queue_path: str = "./reviews.sqlite",
+    facebook_access_token: Optional[str] = None
+) -> MarketingState:
+    """
+    Publish the content of an approved review, picking the run up at publishing.
+    
+    Args:
+        review_id: Review already claimed with ReviewQueue.claim
+        review_queue_path: SQLite queue the review came from
+        facebook_access_token: Facebook access token to publish with
+    
+    Returns:
+        Final state of the publishing and analytics steps
+    """
+    queue = ReviewQueue(review_queue_path)
+    item = queue.get(review_id)
+    if item.status != "publishing":
+        raise ValueError(f"Review {review_id} must be approved and claimed before resuming, status: {item.status}")
+    
+    print(f"Resuming review {review_id} at publishing")
+    with keep_lease(lambda: queue.heartbeat(review_id)):
+        final_state = create_publish_graph().invoke(build_resume_state(item, review_queue_path, facebook_access_token))
+    outcome = review_outcome(item, final_state)
+    queue.finish(review_id, outcome)
+    
+    for error in final_state.get("errors", []):
+        print(f"There is an error:{error}")
+    if outcome == "failed":
+        print(
+            f"Nothing was published; retry with: python -m agent.review_queue --queue {review_queue_path} retry {review_id}, "
+            f"then publish {review_id} --facebook-access-token <token>"
+        )
+    else:
+        print(f"Review {review_id} {outcome}")
+    return final_state
+
 
 if __name__ == "__main__":
 
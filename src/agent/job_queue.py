@@ -0,0 +1,291 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from pydantic import BaseModel, Field
+
+
+class TenantConfig(BaseModel):
+    tenant_id: str = Field(..., description="Unique brand identifier")
+    facebook_page_id: Optional[str] = Field(None, description="FB Page ID the brand publishes to")
+    facebook_access_token_env: Optional[str] = Field(
+        None, description="Environment variable holding the FB Page Access Token, which is never stored in the queue"
+    )
+    db_path: str = Field(..., description="Root directory of the brand's vector stores")
+
+
+class JobRequest(BaseModel):
+    query: str = Field(..., description="Search query for finding relevant news")
+    local_pdf_path: Optional[str] = Field(None, description="Optional local PDF for additional context")
+    skip_publishing: bool = False
+    skip_analytics: bool = False
+    deadline_seconds: Optional[float] = Field(None, description="Wall-clock SLA for the run")
+    token_budget: Optional[int] = Field(None, description="Max LLM tokens for the run")
+    require_human_approval: bool = Field(False, description="Queue content for review instead of publishing")
+
+
+# A running job's lease lasts this long past its last heartbeat; only expired leases are requeued
+LEASE_SECONDS = 120.0
+HEARTBEAT_SECONDS = 20.0
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    tenant_id: str
+    request: JobRequest
+    status: str = Field(..., description="queued, running, awaiting_review, succeeded or failed")
+    worker_id: Optional[str] = Field(None, description="Dispatcher that claimed the job")
+    heartbeat_at: Optional[float] = Field(None, description="Last time the process running the job renewed its lease")
+    current_node: Optional[str] = Field(None, description="Last graph node that finished")
+    completed_nodes: List[str] = Field(default_factory=list)
+    errors: List[str] = Field(default_factory=list)
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = Field(None, description="JSON-serialised final state")
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tenants (
+    tenant_id TEXT PRIMARY KEY,
+    config TEXT NOT NULL,
+    last_claimed_at REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    tenant_id TEXT NOT NULL REFERENCES tenants(tenant_id),
+    request TEXT NOT NULL,
+    status TEXT NOT NULL,
+    current_node TEXT,
+    completed_nodes TEXT NOT NULL DEFAULT '[]',
+    errors TEXT NOT NULL DEFAULT '[]',
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    result TEXT,
+    worker_id TEXT,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_tenant ON jobs(status, tenant_id, created_at);
+"""
+
+
+class JobQueue:
+    """Durable SQLite-backed queue of pipeline jobs, shared by the dispatcher and worker processes"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            # Queues created before job leases existed
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, sql_type in (("worker_id", "TEXT"), ("heartbeat_at", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {sql_type}")
+            # Tenants saved when access tokens were still stored with their config
+            for row in conn.execute("SELECT tenant_id, config FROM tenants").fetchall():
+                config = json.loads(row["config"])
+                if config.pop("facebook_access_token", None) is not None:
+                    conn.execute("UPDATE tenants SET config = ? WHERE tenant_id = ?", (json.dumps(config), row["tenant_id"]))
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # One short-lived connection per operation keeps the queue safe to use across processes
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def add_tenant(self, tenant: TenantConfig) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO tenants (tenant_id, config) VALUES (?, ?) "
+                "ON CONFLICT(tenant_id) DO UPDATE SET config = excluded.config",
+                (tenant.tenant_id, tenant.model_dump_json())
+            )
+
+    def get_tenant(self, tenant_id: str) -> TenantConfig:
+        with self._connect() as conn:
+            row = conn.execute("SELECT config FROM tenants WHERE tenant_id = ?", (tenant_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown tenant: {tenant_id}")
+        return TenantConfig.model_validate_json(row["config"])
+
+    def submit(self, tenant_id: str, request: JobRequest) -> str:
+        self.get_tenant(tenant_id)
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, tenant_id, request, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, tenant_id, request.model_dump_json(), time.time())
+            )
+        return job_id
+
+    def claim_next(self, worker_id: str) -> Optional[str]:
+        """Mark the next job as running, picking the tenant with the fewest running jobs, then the least recently served"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("""
+                    SELECT j.job_id, j.tenant_id FROM jobs j JOIN tenants t ON t.tenant_id = j.tenant_id
+                    WHERE j.status = 'queued'
+                    ORDER BY
+                        (SELECT COUNT(*) FROM jobs r WHERE r.tenant_id = j.tenant_id AND r.status = 'running'),
+                        t.last_claimed_at,
+                        j.created_at
+                    LIMIT 1
+                """).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                now = time.time()
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, worker_id = ?, heartbeat_at = ? WHERE job_id = ?",
+                    (now, worker_id, now, row["job_id"])
+                )
+                conn.execute(
+                    "UPDATE tenants SET last_claimed_at = ? WHERE tenant_id = ?",
+                    (now, row["tenant_id"])
+                )
+                conn.execute("COMMIT")
+                return row["job_id"]
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def heartbeat(self, job_id: str) -> None:
+        """Renew the lease of a running job"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE job_id = ? AND status = 'running'", (time.time(), job_id)
+            )
+
+    def requeue_stale(self, lease_seconds: float = LEASE_SECONDS) -> int:
+        """
+        Put jobs whose lease expired back in the queue.
+
+        Only a job nobody has renewed for lease_seconds is requeued, so jobs still running in another
+        dispatcher, or in pool processes that outlived a restart, are not run twice.
+        """
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, current_node = NULL, completed_nodes = '[]', "
+                "worker_id = NULL, heartbeat_at = NULL "
+                "WHERE status = 'running' AND COALESCE(heartbeat_at, 0) < ?",
+                (time.time() - lease_seconds,)
+            )
+            return cur.rowcount
+
+    def record_node(self, job_id: str, node: str, errors: List[str]) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET current_node = ?, completed_nodes = json_insert(completed_nodes, '$[#]', ?), "
+                "errors = ? WHERE job_id = ?",
+                (node, node, json.dumps(errors), job_id)
+            )
+
+    def finish(self, job_id: str, result: Dict[str, Any], errors: List[str]) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'succeeded', finished_at = ?, result = ?, errors = ? WHERE job_id = ?",
+                (time.time(), json.dumps(result), json.dumps(errors), job_id)
+            )
+
+    def await_review(self, job_id: str, result: Dict[str, Any], errors: List[str]) -> None:
+        """Park a job whose content is in the review queue; it no longer holds a worker"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'awaiting_review', result = ?, errors = ? WHERE job_id = ?",
+                (json.dumps(result), json.dumps(errors), job_id)
+            )
+
+    def fail(self, job_id: str, error: str, result: Optional[Dict[str, Any]] = None) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, result = COALESCE(?, result), "
+                "errors = json_insert(errors, '$[#]', ?) WHERE job_id = ?",
+                (time.time(), json.dumps(result) if result is not None else None, error, job_id)
+            )
+
+    def status(self, job_id: str) -> JobStatus:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown job: {job_id}")
+        return _row_to_status(row)
+
+    def list_jobs(self, tenant_id: Optional[str] = None, status: Optional[str] = None) -> List[JobStatus]:
+        query, params = "SELECT * FROM jobs WHERE 1 = 1", []
+        if tenant_id is not None:
+            query += " AND tenant_id = ?"
+            params.append(tenant_id)
+        if status is not None:
+            query += " AND status = ?"
+            params.append(status)
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY created_at", params).fetchall()
+        return [_row_to_status(row) for row in rows]
+
+
+def _row_to_status(row: sqlite3.Row) -> JobStatus:
+    return JobStatus(
+        job_id=row["job_id"],
+        tenant_id=row["tenant_id"],
+        request=JobRequest.model_validate_json(row["request"]),
+        status=row["status"],
+        current_node=row["current_node"],
+        completed_nodes=json.loads(row["completed_nodes"]),
+        errors=json.loads(row["errors"]),
+        created_at=row["created_at"],
+        started_at=row["started_at"],
+        finished_at=row["finished_at"],
+        result=json.loads(row["result"]) if row["result"] else None,
+        worker_id=row["worker_id"],
+        heartbeat_at=row["heartbeat_at"]
+    )
+
+
+@contextmanager
+def keep_lease(renew: Callable[[], None]) -> Iterator[None]:
+    """Call renew every HEARTBEAT_SECONDS from a background thread, for as long as the block runs"""
+    stop = threading.Event()
+
+    def heartbeat() -> None:
+        while not stop.wait(HEARTBEAT_SECONDS):
+            renew()
+
+    thread = threading.Thread(target=heartbeat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def tenant_db_path(tenant: TenantConfig, job_id: str) -> str:
+    """Vector-store namespace for one job, isolated per tenant and per run"""
+    return os.path.join(tenant.db_path, tenant.tenant_id, job_id)
+
+
+def tenant_content_index_path(tenant: TenantConfig) -> str:
+    """Published-post index shared by all of a tenant's jobs"""
+    return os.path.join(tenant.db_path, tenant.tenant_id, "published_index")
+
+
+def tenant_doc_store_path(tenant: TenantConfig) -> str:
+    """Document store shared by all of a tenant's jobs, so pages and PDFs are fetched and parsed once"""
+    return os.path.join(tenant.db_path, tenant.tenant_id, "doc_store")
+
+
+def tenant_access_token(tenant: TenantConfig) -> Optional[str]:
+    """FB Page Access Token of a tenant, read from its environment variable when a job runs"""
+    return os.getenv(tenant.facebook_access_token_env) if tenant.facebook_access_token_env else None
@@ -0,0 +1,278 @@
+import argparse
+import json
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from pydantic import BaseModel, Field
+
+from agent.job_queue import LEASE_SECONDS
+from agent.services.content_schema import AllMarketingContents
+
+
+class ReviewItem(BaseModel):
+    review_id: str
+    job_id: Optional[str] = Field(None, description="Worker job that produced the content, if any")
+    query: str
+    status: str = Field(..., description="pending, approved, rejected, publishing, published, failed or closed")
+    contents: AllMarketingContents
+    feedback: Optional[str] = None
+    created_at: float
+    decided_at: Optional[float] = None
+    heartbeat_at: Optional[float] = Field(None, description="Last time the process publishing the review renewed its lease")
+    resume_state: Dict[str, Any] = Field(default_factory=dict, description="JSON state needed to resume at publishing")
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reviews (
+    review_id TEXT PRIMARY KEY,
+    job_id TEXT,
+    query TEXT NOT NULL,
+    status TEXT NOT NULL,
+    contents TEXT NOT NULL,
+    feedback TEXT,
+    created_at REAL NOT NULL,
+    decided_at REAL,
+    resume_state TEXT NOT NULL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS reviews_status ON reviews(status, decided_at);
+"""
+
+
+class ReviewQueue:
+    """Durable SQLite queue of generated content waiting for a human decision"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            # Queues created before review leases existed
+            if "heartbeat_at" not in {row["name"] for row in conn.execute("PRAGMA table_info(reviews)")}:
+                conn.execute("ALTER TABLE reviews ADD COLUMN heartbeat_at REAL")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(
+        self,
+        query: str,
+        contents: AllMarketingContents,
+        resume_state: Dict[str, Any],
+        job_id: Optional[str] = None
+    ) -> str:
+        review_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO reviews (review_id, job_id, query, status, contents, created_at, resume_state) "
+                "VALUES (?, ?, ?, 'pending', ?, ?, ?)",
+                (review_id, job_id, query, contents.model_dump_json(), time.time(), json.dumps(resume_state))
+            )
+        return review_id
+
+    def get(self, review_id: str) -> ReviewItem:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM reviews WHERE review_id = ?", (review_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown review: {review_id}")
+        return _row_to_item(row)
+
+    def list_reviews(self, status: Optional[str] = "pending") -> List[ReviewItem]:
+        with self._connect() as conn:
+            if status is None:
+                rows = conn.execute("SELECT * FROM reviews ORDER BY created_at").fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM reviews WHERE status = ? ORDER BY created_at", (status,)).fetchall()
+        return [_row_to_item(row) for row in rows]
+
+    def decide(self, review_id: str, approved: bool, feedback: Optional[str] = None) -> ReviewItem:
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE reviews SET status = ?, feedback = ?, decided_at = ? WHERE review_id = ? AND status = 'pending'",
+                ("approved" if approved else "rejected", feedback, time.time(), review_id)
+            )
+        if cur.rowcount == 0:
+            raise ValueError(f"Review {review_id} is not pending: {self.get(review_id).status}")
+        return self.get(review_id)
+
+    def claim(self, review_id: str) -> bool:
+        """Mark one approved review as publishing; False if it was not approved or another process got it first"""
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE reviews SET status = 'publishing', heartbeat_at = ? WHERE review_id = ? AND status = 'approved'",
+                (time.time(), review_id)
+            )
+        return cur.rowcount == 1
+
+    def claim_decided(self) -> Optional[ReviewItem]:
+        """
+        Take the oldest decided review off the queue so exactly one worker handles it.
+
+        Approved reviews move to publishing and rejected ones to closed; the returned item
+        keeps the decision it was claimed with.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM reviews WHERE status IN ('approved', 'rejected') ORDER BY decided_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE reviews SET status = ?, heartbeat_at = ? WHERE review_id = ?",
+                        ("publishing" if row["status"] == "approved" else "closed", time.time(), row["review_id"])
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return _row_to_item(row) if row is not None else None
+
+    def heartbeat(self, review_id: str) -> None:
+        """Renew the lease of a review being published"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE reviews SET heartbeat_at = ? WHERE review_id = ? AND status = 'publishing'",
+                (time.time(), review_id)
+            )
+
+    def finish(self, review_id: str, status: str) -> None:
+        """
+        Record how publishing a claimed review ended.
+
+        Args:
+            review_id: Review in publishing
+            status: published if at least one post went out, closed if there was nothing to post,
+                failed if posting failed; failed reviews can be retried
+        """
+        if status not in ("published", "closed", "failed"):
+            raise ValueError(f"Invalid final review status: {status}")
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE reviews SET status = ?, heartbeat_at = NULL WHERE review_id = ?", (status, review_id)
+            )
+
+    def retry(self, review_id: str) -> ReviewItem:
+        """Approve a failed review again so it is published on the next claim"""
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE reviews SET status = 'approved', decided_at = ? WHERE review_id = ? AND status = 'failed'",
+                (time.time(), review_id)
+            )
+        if cur.rowcount == 0:
+            raise ValueError(f"Review {review_id} has not failed: {self.get(review_id).status}")
+        return self.get(review_id)
+
+    def requeue_stale(self, lease_seconds: float = LEASE_SECONDS) -> int:
+        """
+        Hand back reviews whose publishing lease expired, e.g. after a worker crashed.
+
+        Reviews still being published by a live process keep their lease, so they are not posted twice.
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE reviews SET status = 'approved', heartbeat_at = NULL "
+                "WHERE status = 'publishing' AND COALESCE(heartbeat_at, 0) < ?",
+                (time.time() - lease_seconds,)
+            ).rowcount
+
+
+def _row_to_item(row: sqlite3.Row) -> ReviewItem:
+    return ReviewItem(
+        review_id=row["review_id"],
+        job_id=row["job_id"],
+        query=row["query"],
+        status=row["status"],
+        contents=AllMarketingContents.model_validate_json(row["contents"]),
+        feedback=row["feedback"],
+        created_at=row["created_at"],
+        decided_at=row["decided_at"],
+        heartbeat_at=row["heartbeat_at"],
+        resume_state=json.loads(row["resume_state"])
+    )
+
+
+def _print_review(item: ReviewItem) -> None:
+    print(f"\n[Review {item.review_id}] status: {item.status} | query: {item.query}")
+    for idx, content in enumerate(item.contents.contents, 1):
+        print(f"\n[Content #{idx}]")
+        print(f"  Format: {content.content_format}")
+        print(f"  Headline: {content.headline}")
+        print(f"  Target Audience: {content.target_audience}")
+        print(f"  Channels: {', '.join(content.distribution_channel)}")
+        print(f"  Body: {content.body_text[:200]}...")
+        print(f"  CTA: {content.call_to_action}")
+        print("-" * 10)
+
+
+def _publish(queue: ReviewQueue, review_id: str, facebook_access_token: str) -> None:
+    if not queue.claim(review_id):
+        # A worker may have claimed it first, or it is not approved (yet)
+        raise SystemExit(f"Review {review_id} cannot be published, status: {queue.get(review_id).status}")
+    # Imported here so listing and deciding do not compile the pipeline graphs
+    from agent.graph import resume_review
+    resume_review(review_id, queue.path, facebook_access_token=facebook_access_token)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Review generated marketing content")
+    parser.add_argument("--queue", default="./reviews.sqlite", help="Path of the SQLite review queue")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    list_cmd = sub.add_parser("list", help="List reviews")
+    list_cmd.add_argument("--status", default="pending")
+
+    show_cmd = sub.add_parser("show", help="Show the content of a review")
+    show_cmd.add_argument("review_id")
+
+    for name in ("approve", "reject"):
+        decide_cmd = sub.add_parser(name, help=f"{name.capitalize()} a pending review")
+        decide_cmd.add_argument("review_id")
+        decide_cmd.add_argument("--feedback")
+    sub.choices["approve"].add_argument(
+        "--publish-now", action="store_true", help="Publish in this process instead of leaving it to a worker"
+    )
+    sub.choices["approve"].add_argument(
+        "--facebook-access-token", help="Page access token, required with --publish-now; it is never stored in the queue"
+    )
+
+    publish_cmd = sub.add_parser("publish", help="Publish an approved review in this process")
+    publish_cmd.add_argument("review_id")
+    publish_cmd.add_argument(
+        "--facebook-access-token", required=True, help="Page access token; it is never stored in the queue"
+    )
+
+    retry_cmd = sub.add_parser("retry", help="Approve a review whose publishing failed again")
+    retry_cmd.add_argument("review_id")
+
+    args = parser.parse_args()
+    if args.command == "approve" and args.publish_now and not args.facebook_access_token:
+        parser.error("--publish-now requires --facebook-access-token")
+    queue = ReviewQueue(args.queue)
+
+    if args.command == "list":
+        for item in queue.list_reviews(status=None if args.status == "all" else args.status):
+            print(f"{item.review_id} {item.status} {len(item.contents.contents)} content(s) | {item.query}")
+    elif args.command == "show":
+        _print_review(queue.get(args.review_id))
+    elif args.command in ("approve", "reject"):
+        item = queue.decide(args.review_id, approved=args.command == "approve", feedback=args.feedback)
+        print(f"Review {item.review_id} {item.status}")
+        if args.command == "approve" and args.publish_now:
+            _publish(queue, item.review_id, args.facebook_access_token)
+    elif args.command == "publish":
+        _publish(queue, args.review_id, args.facebook_access_token)
+    elif args.command == "retry":
+        item = queue.retry(args.review_id)
+        print(f"Review {item.review_id} {item.status}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from typing import List, Optional
 from pydantic import BaseModel, Field
-import requests
+from agent.services.resilience import http_request
 
 class PostPerformance(BaseModel):
     post_id: str
@@ -31,8 +31,7 @@ def analytics_agent(post_ids: List[str], access_token: str) -> AnalyticsReport:
         }
         
         try:
-            resp = requests.get(url, params=params, timeout=10)
-            resp.raise_for_status()
+            resp = http_request("facebook_insights", "GET", url, params=params)
             data = resp.json().get("data", [])
             
             stats = {item["name"]: item["values"][0]["value"] for item in data}
@@ -1,7 +1,7 @@
 from typing import List
 from pydantic import BaseModel, Field
-import requests
-from agent.services.content_generation import AllMarketingContents
+from agent.services.resilience import http_request
+from agent.services.content_schema import AllMarketingContents
 
 class FacebookPostRequest(BaseModel):
     marketing_data: AllMarketingContents
@@ -35,8 +35,7 @@ def distributor_agent(request: FacebookPostRequest) -> DistributorOutput:
             }
 
             try:
-                resp = requests.post(url, data=payload, timeout=15)
-                resp.raise_for_status()
+                resp = http_request("facebook_publish", "POST", url, data=payload)
                 api_res = resp.json()
                 
                 final_results.append(SinglePostResult(
@@ -1,23 +1,9 @@
-from typing import List
-from pydantic import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate
-from llm_model import _make_llm_with_structure
+from llm_model import StructuredLLM
 from agent.services.insights_extract import AllStrategicInsights
+from agent.services.content_schema import MarketingContent, AllMarketingContents
 
-class MarketingContent(BaseModel):
-    insight_id: str = Field(..., description="Matches the ID from the source insight")
-    content_format: str = Field(..., description="e.g., Blog, Articles, Poster, Video Script, Study Case")
-    headline: str = Field(..., description="Catchy headline for the content")
-    body_text: str = Field(..., description="The full copy of the marketing content")
-    call_to_action: str = Field(..., description="Clear CTA for the reader")
-    target_audience: str = Field(..., description="Primary persona this content targets")
-    distribution_channel: List[str] = Field(..., description="Recommended channels, e.g., ['LinkedIn', 'Twitter']")
-    sources: List[str] = Field(..., description="Reference IDs or links used")
-
-class AllMarketingContents(BaseModel):
-    contents: List[MarketingContent]
-
-content_llm = _make_llm_with_structure(AllMarketingContents, "gpt-5-nano", 0.7)
+content_llm = StructuredLLM(AllMarketingContents, "gpt-5-nano", 0.7)
 
 CONTENT_PROMPT = ChatPromptTemplate.from_template("""
     You are an expert Marketing Strategist. 
@@ -39,10 +25,10 @@ def marketing_content_agent(insights: AllStrategicInsights) -> AllMarketingConte
         for i in insights.insights
     )
 
-    chain = CONTENT_PROMPT | content_llm
-
-    res = chain.invoke({"insights": formatted_insights})
-
-    if isinstance(res, AllMarketingContents):
-        return res
-    return AllMarketingContents(**res) if isinstance(res, dict) else res
\ No newline at end of file
+    # One content per insight; only insights whose content is missing or invalid are re-requested
+    return content_llm.invoke(
+        CONTENT_PROMPT,
+        {"insights": formatted_insights},
+        id_field="insight_id",
+        expected_ids=[i.insight_id for i in insights.insights]
+    )
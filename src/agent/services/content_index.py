@@ -0,0 +1,271 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Literal, Optional, Tuple
+import numpy as np
+from pydantic import BaseModel, Field
+from langchain_community.vectorstores.chroma import Chroma
+from llm_model import _embed_model
+from agent.services.content_schema import AllMarketingContents, MarketingContent
+
+NUM_PERM = 128
+LSH_BANDS = 32  # 32 bands of 4 rows: pairs above ~0.6 Jaccard almost always share a bucket
+SHINGLE_SIZE = 3
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = np.random.RandomState(1)
+# Multipliers span the whole prime field; with small ones a*h stays ordered by h and the min is biased
+_PERM_A = _rng.randint(1, _MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, _MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+
+
+class DedupPolicy(BaseModel):
+    action: Literal["skip", "flag", "off"] = Field("skip", description="skip: do not post near-duplicates, flag: post but report them, off: no lookup")
+    minhash_threshold: float = Field(0.8, description="Estimated Jaccard similarity of word shingles treated as a near-duplicate")
+    embedding_threshold: float = Field(0.95, description="Cosine relevance of embeddings treated as a near-duplicate")
+    top_k: int = Field(5, description="Number of historical posts returned per lookup")
+    use_embeddings: bool = Field(False, description="Opt in to also query embeddings and catch paraphrases, at one embedding call per lookup; MinHash alone stays local and sub-millisecond")
+
+
+class SimilarPost(BaseModel):
+    post_id: str
+    text: str
+    minhash_similarity: float = 0.0
+    embedding_similarity: float = 0.0
+
+
+class DedupDecision(BaseModel):
+    content_id: str
+    headline: str
+    is_duplicate: bool
+    action: str = Field(..., description="kept, skipped or flagged")
+    matches: List[SimilarPost] = Field(default_factory=list)
+
+
+class DedupReport(BaseModel):
+    decisions: List[DedupDecision] = Field(default_factory=list)
+
+
+def content_text(content: MarketingContent) -> str:
+    return f"{content.headline}\n\n{content.body_text}"
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    words = re.findall(r"\w+", text.lower())
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))}
+    # crc32 is stable across processes, unlike hash(), so stored signatures stay comparable
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+    permuted = (hashes[:, None] * _PERM_A + _PERM_B) % _MERSENNE_PRIME
+    return (permuted.min(axis=0) & 0xFFFFFFFF).astype(np.uint32)
+
+
+def _band_hashes(signatures: np.ndarray) -> np.ndarray:
+    """Hash each LSH band of an (n, NUM_PERM) signature array to one uint64, giving (n, LSH_BANDS)"""
+    words = np.ascontiguousarray(signatures).view(np.uint64).reshape(len(signatures), LSH_BANDS, -1)
+    hashes = np.zeros((len(signatures), LSH_BANDS), dtype=np.uint64)
+    for i in range(words.shape[2]):
+        # Collisions only add candidates, which are verified against full signatures anyway
+        hashes = (hashes * np.uint64(0x9E3779B97F4A7C15)) ^ words[:, :, i]
+    return hashes
+
+
+class ContentIndex:
+    """
+    Local index of published posts for near-duplicate lookups.
+
+    MinHash signatures live in SQLite and are bucketed in memory by LSH band, so a lookup
+    only compares against posts sharing a band. When use_embeddings is set, embeddings are
+    also kept in a Chroma collection next to it for paraphrases that share few exact shingles;
+    only posts added with it set are found that way.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._db = os.path.join(path, "posts.sqlite")
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS posts ("
+                "post_id TEXT PRIMARY KEY, text TEXT NOT NULL, signature BLOB NOT NULL, published_at REAL NOT NULL)"
+            )
+        self._post_ids: List[str] = []
+        self._texts: List[str] = []
+        self._signatures = np.zeros((0, NUM_PERM), dtype=np.uint32)
+        # Posts loaded from disk are bucketed as per-band sorted hash arrays, searched with searchsorted;
+        # posts added since are kept in a small dict until the next load
+        self._band_sorted = np.zeros((LSH_BANDS, 0), dtype=np.uint64)
+        self._band_order = np.zeros((LSH_BANDS, 0), dtype=np.int64)
+        self._recent: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        self._vectorstore: Optional[Chroma] = None
+        self._last_rowid = 0
+        self._load()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self._db)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _load(self) -> None:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT rowid, post_id, text, signature FROM posts ORDER BY rowid").fetchall()
+        if not rows:
+            return
+        self._last_rowid = rows[-1][0]
+        self._post_ids = [r[1] for r in rows]
+        self._texts = [r[2] for r in rows]
+        self._signatures = np.frombuffer(b"".join(r[3] for r in rows), dtype=np.uint32).reshape(len(rows), NUM_PERM).copy()
+        hashes = _band_hashes(self._signatures).T
+        self._band_order = np.argsort(hashes, axis=1, kind="stable")
+        self._band_sorted = np.take_along_axis(hashes, self._band_order, axis=1)
+
+    def _append(self, post_id: str, text: str, signature: np.ndarray) -> None:
+        idx = len(self._post_ids)
+        if idx == len(self._signatures):
+            # Grow by doubling so repeated adds stay amortised O(1)
+            grown = np.zeros((max(2 * idx, 64), NUM_PERM), dtype=np.uint32)
+            grown[:idx] = self._signatures[:idx]
+            self._signatures = grown
+        self._signatures[idx] = signature
+        self._post_ids.append(post_id)
+        self._texts.append(text)
+        for band, h in enumerate(_band_hashes(signature[None, :])[0]):
+            self._recent[(band, int(h))].append(idx)
+
+    def refresh(self) -> None:
+        """Pick up posts published by other processes since this index was loaded"""
+        with self._lock:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT rowid, post_id, text, signature FROM posts WHERE rowid > ? ORDER BY rowid",
+                    (self._last_rowid,)
+                ).fetchall()
+            for rowid, post_id, text, signature in rows:
+                self._append(post_id, text, np.frombuffer(signature, dtype=np.uint32))
+                self._last_rowid = rowid
+
+    def __len__(self) -> int:
+        return len(self._post_ids)
+
+    def _embeddings(self) -> Chroma:
+        if self._vectorstore is None:
+            self._vectorstore = Chroma(
+                collection_name="published_content",
+                embedding_function=_embed_model(model="text-embedding-ada-002"),
+                persist_directory=os.path.join(self.path, "chroma"),
+                collection_metadata={"hnsw:space": "cosine"}
+            )
+        return self._vectorstore
+
+    def similar_by_minhash(self, text: str, k: int = 5) -> List[SimilarPost]:
+        signature = minhash_signature(text)
+        band_hashes = _band_hashes(signature[None, :])[0]
+        candidates = set()
+        for band, h in enumerate(band_hashes):
+            lo = np.searchsorted(self._band_sorted[band], h, side="left")
+            hi = np.searchsorted(self._band_sorted[band], h, side="right")
+            candidates.update(self._band_order[band, lo:hi].tolist())
+            candidates.update(self._recent.get((band, int(h)), ()))
+        if not candidates:
+            return []
+        idx = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        scores = (self._signatures[idx] == signature).mean(axis=1)
+        top = np.argsort(-scores)[:k]
+        return [
+            SimilarPost(post_id=self._post_ids[idx[i]], text=self._texts[idx[i]], minhash_similarity=float(scores[i]))
+            for i in top
+        ]
+
+    def similar_by_embedding(self, text: str, k: int = 5) -> List[SimilarPost]:
+        if not self._post_ids:
+            return []
+        hits = self._embeddings().similarity_search_with_relevance_scores(text, k=k)
+        return [
+            SimilarPost(post_id=doc.metadata["post_id"], text=doc.page_content, embedding_similarity=score)
+            for doc, score in hits
+        ]
+
+    def lookup(self, text: str, k: int = 5, use_embeddings: bool = False) -> List[SimilarPost]:
+        """Top-k historical posts by the higher of MinHash and embedding similarity"""
+        merged: Dict[str, SimilarPost] = {p.post_id: p for p in self.similar_by_minhash(text, k)}
+        if use_embeddings:
+            try:
+                for hit in self.similar_by_embedding(text, k):
+                    if hit.post_id in merged:
+                        merged[hit.post_id].embedding_similarity = hit.embedding_similarity
+                    else:
+                        merged[hit.post_id] = hit
+            except Exception as e:
+                print(f"Embedding lookup failed, using MinHash only: {e}")
+        ranked = sorted(merged.values(), key=lambda p: max(p.minhash_similarity, p.embedding_similarity), reverse=True)
+        return ranked[:k]
+
+    def add(self, post_id: str, text: str, use_embeddings: bool = False) -> None:
+        signature = minhash_signature(text)
+        with self._connect() as conn:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO posts (post_id, text, signature, published_at) VALUES (?, ?, ?, ?)",
+                (post_id, text, signature.tobytes(), time.time())
+            )
+        if cur.rowcount == 0:
+            return
+        # Read back through refresh so rows other processes inserted before ours are not skipped
+        self.refresh()
+        if use_embeddings:
+            try:
+                self._embeddings().add_texts([text], metadatas=[{"post_id": post_id}], ids=[post_id])
+            except Exception as e:
+                print(f"Could not embed published post {post_id}: {e}")
+
+
+_indexes: Dict[str, ContentIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_content_index(path: str) -> ContentIndex:
+    """Process-wide index per path, loaded once and then refreshed incrementally"""
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = ContentIndex(path)
+    index = _indexes[path]
+    index.refresh()
+    return index
+
+
+def dedup_agent(
+    contents: AllMarketingContents,
+    index: ContentIndex,
+    policy: DedupPolicy
+) -> Tuple[AllMarketingContents, DedupReport]:
+    """Check each content against published history; return what should be posted and why"""
+    if policy.action == "off":
+        return contents, DedupReport()
+
+    kept, report = [], DedupReport()
+    for content in contents.contents:
+        matches = index.lookup(content_text(content), k=policy.top_k, use_embeddings=policy.use_embeddings)
+        is_duplicate = any(
+            m.minhash_similarity >= policy.minhash_threshold or m.embedding_similarity >= policy.embedding_threshold
+            for m in matches
+        )
+        if is_duplicate and policy.action == "skip":
+            action = "skipped"
+        else:
+            action = "flagged" if is_duplicate else "kept"
+            kept.append(content)
+        report.decisions.append(DedupDecision(
+            content_id=content.insight_id,
+            headline=content.headline,
+            is_duplicate=is_duplicate,
+            action=action,
+            matches=matches
+        ))
+    return AllMarketingContents(contents=kept), report
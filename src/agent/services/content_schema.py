@@ -0,0 +1,18 @@
+from typing import List
+from pydantic import BaseModel, Field
+
+# Kept apart from content_generation, which builds its LLM client at import, so the review queue
+# and other readers of stored content load without OpenAI credentials
+
+class MarketingContent(BaseModel):
+    insight_id: str = Field(..., description="Matches the ID from the source insight")
+    content_format: str = Field(..., description="e.g., Blog, Articles, Poster, Video Script, Study Case")
+    headline: str = Field(..., description="Catchy headline for the content")
+    body_text: str = Field(..., description="The full copy of the marketing content")
+    call_to_action: str = Field(..., description="Clear CTA for the reader")
+    target_audience: str = Field(..., description="Primary persona this content targets")
+    distribution_channel: List[str] = Field(..., description="Recommended channels, e.g., ['LinkedIn', 'Twitter']")
+    sources: List[str] = Field(..., description="Reference IDs or links used")
+
+class AllMarketingContents(BaseModel):
+    contents: List[MarketingContent]
@@ -0,0 +1,373 @@
+import hashlib
+import mmap
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from pydantic import BaseModel, Field
+
+SEGMENT_BYTES = 64 * 1024 * 1024  # Active segment is sealed once it would grow past this
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024  # Size cap on all segment files of one store
+CAP_HEADROOM = 0.8  # Eviction frees space down to this share of the cap, so it does not run on every write
+COMPACT_DEAD_SHARE = 0.5  # Segments are rewritten once this share of their bytes is no longer referenced
+WEB_MAX_AGE_SECONDS = 24 * 3600  # Crawled pages older than this are fetched again
+
+_SEGMENT_RE = re.compile(r"^seg-(\d{6})\.dat$")
+
+
+class StoredSource(BaseModel):
+    source: str = Field(..., description="URL, or PDF path plus extraction options")
+    kind: str = Field(..., description="web or pdf")
+    title: str
+    raw_hash: str = Field(..., description="Content hash of the text as fetched or parsed")
+    cleaned_hash: str = Field(..., description="Content hash of the text handed to the pipeline")
+    fingerprint: str = Field("", description="Change marker of the source, e.g. PDF size and mtime")
+    llm_cleaned: bool = True
+    updated_at: float
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    compressed INTEGER NOT NULL,
+    text_bytes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blobs_segment ON blobs(segment);
+CREATE TABLE IF NOT EXISTS sources (
+    source TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    title TEXT NOT NULL,
+    raw_hash TEXT NOT NULL,
+    cleaned_hash TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    llm_cleaned INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sources_last_access ON sources(last_access);
+"""
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DocStore:
+    """
+    Append-only on-disk store of raw and cleaned document text, keyed by content hash.
+
+    Text is appended to segment files and located through an offset index in SQLite,
+    which also maps each URL or PDF to the hashes of its raw and cleaned text. Reads go
+    through a read-only mmap of the segment, so only the documents being used are paged
+    in. Identical text is stored once. Appends from several processes are serialised by
+    the index's write transaction.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        compress: bool = True,
+        segment_bytes: int = SEGMENT_BYTES
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.segment_bytes = segment_bytes
+        os.makedirs(path, exist_ok=True)
+        self._db = os.path.join(path, "index.sqlite")
+        self._lock = threading.Lock()
+        self._maps: Dict[int, Tuple[object, mmap.mmap]] = {}
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self._db, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"seg-{segment:06d}.dat")
+
+    def _segments(self) -> Dict[int, int]:
+        """Segment id -> file size, for all segment files on disk"""
+        sizes = {}
+        for name in os.listdir(self.path):
+            match = _SEGMENT_RE.match(name)
+            if match:
+                sizes[int(match.group(1))] = os.path.getsize(os.path.join(self.path, name))
+        return sizes
+
+    def _read(self, segment: int, offset: int, length: int) -> bytes:
+        """Slice a record out of the segment's read-only map, remapping once the segment has grown"""
+        end = offset + length
+        # Held across the slice so a compaction in another thread cannot close the map mid-read
+        with self._lock:
+            cached = self._maps.get(segment)
+            if cached is None or len(cached[1]) < end:
+                if cached is not None:
+                    cached[1].close()
+                    cached[0].close()
+                f = open(self._segment_path(segment), "rb")
+                cached = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                self._maps[segment] = cached
+            return cached[1][offset:end]
+
+    def _unmap(self, segment: int) -> None:
+        with self._lock:
+            cached = self._maps.pop(segment, None)
+        if cached is not None:
+            cached[1].close()
+            cached[0].close()
+
+    def close(self) -> None:
+        for segment in list(self._maps):
+            self._unmap(segment)
+
+    def _append(self, conn: sqlite3.Connection, payload: bytes) -> Tuple[int, int]:
+        """Append payload to the active segment; must run inside the index's write transaction"""
+        sizes = self._segments()
+        segment = max(sizes) if sizes else 1
+        size = sizes.get(segment, 0)
+        if size and size + len(payload) > self.segment_bytes:
+            segment, size = segment + 1, 0
+        with open(self._segment_path(segment), "ab") as f:
+            # Bytes left behind by a writer that died before committing its index row are skipped
+            offset = f.tell()
+            f.write(payload)
+        return segment, offset
+
+    def put_text(self, text: str) -> str:
+        """Store text once and return its content hash"""
+        key = content_hash(text)
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (key,)).fetchone():
+                return key
+            data = text.encode("utf-8")
+            payload, compressed = data, False
+            if self.compress:
+                packed = zlib.compress(data, 6)
+                if len(packed) < len(data):
+                    payload, compressed = packed, True
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if not conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (key,)).fetchone():
+                    segment, offset = self._append(conn, payload)
+                    conn.execute(
+                        "INSERT INTO blobs (hash, segment, offset, length, compressed, text_bytes) VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, segment, offset, len(payload), int(compressed), len(data))
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return key
+
+    def get_text(self, key: str) -> str:
+        """Text stored under a content hash, read from the segment's mmap"""
+        for attempt in range(2):
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT segment, offset, length, compressed FROM blobs WHERE hash = ?", (key,)
+                ).fetchone()
+            if row is None:
+                raise KeyError(f"No text stored under {key}")
+            segment, offset, length, compressed = row
+            try:
+                payload = self._read(segment, offset, length)
+                break
+            except FileNotFoundError:
+                # Another process compacted the segment away between the lookup and the read
+                if attempt:
+                    raise
+        data = zlib.decompress(payload) if compressed else payload
+        return data.decode("utf-8")
+
+    def get_source(self, source: str) -> Optional[StoredSource]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT source, kind, title, raw_hash, cleaned_hash, fingerprint, llm_cleaned, updated_at "
+                "FROM sources WHERE source = ?", (source,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE sources SET last_access = ? WHERE source = ?", (time.time(), source))
+        return StoredSource(
+            source=row[0], kind=row[1], title=row[2], raw_hash=row[3], cleaned_hash=row[4],
+            fingerprint=row[5], llm_cleaned=bool(row[6]), updated_at=row[7]
+        )
+
+    def put_source(
+        self,
+        source: str,
+        kind: str,
+        title: str,
+        raw_text: str,
+        cleaned_text: str,
+        fingerprint: str = "",
+        llm_cleaned: bool = True
+    ) -> StoredSource:
+        """Store raw and cleaned text of a URL or PDF, replacing what was stored for it before"""
+        raw_hash, cleaned_hash = content_hash(raw_text), content_hash(cleaned_text)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO sources (source, kind, title, raw_hash, cleaned_hash, fingerprint, llm_cleaned, updated_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(source) DO UPDATE SET "
+                "kind = excluded.kind, title = excluded.title, raw_hash = excluded.raw_hash, "
+                "cleaned_hash = excluded.cleaned_hash, fingerprint = excluded.fingerprint, "
+                "llm_cleaned = excluded.llm_cleaned, updated_at = excluded.updated_at, last_access = excluded.last_access",
+                (source, kind, title, raw_hash, cleaned_hash, fingerprint, int(llm_cleaned), now, now)
+            )
+        # Text goes in after the source row references it, so a concurrent eviction cannot drop it as an orphan
+        self.put_text(raw_text)
+        if cleaned_hash != raw_hash:
+            self.put_text(cleaned_text)
+        self.enforce_cap()
+        return StoredSource(
+            source=source, kind=kind, title=title, raw_hash=raw_hash, cleaned_hash=cleaned_hash,
+            fingerprint=fingerprint, llm_cleaned=llm_cleaned, updated_at=now
+        )
+
+    def sources(self, kind: Optional[str] = None) -> List[StoredSource]:
+        """All stored sources, optionally of one kind, without touching their last access time"""
+        query, params = "SELECT source, kind, title, raw_hash, cleaned_hash, fingerprint, llm_cleaned, updated_at FROM sources", ()
+        if kind is not None:
+            query, params = query + " WHERE kind = ?", (kind,)
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY source", params).fetchall()
+        return [
+            StoredSource(
+                source=r[0], kind=r[1], title=r[2], raw_hash=r[3], cleaned_hash=r[4],
+                fingerprint=r[5], llm_cleaned=bool(r[6]), updated_at=r[7]
+            )
+            for r in rows
+        ]
+
+    def disk_bytes(self) -> int:
+        return sum(self._segments().values())
+
+    def live_bytes(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COALESCE(SUM(length), 0) FROM blobs").fetchone()[0]
+
+    def _drop_orphans(self, conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "DELETE FROM blobs WHERE hash NOT IN (SELECT raw_hash FROM sources UNION SELECT cleaned_hash FROM sources)"
+        )
+
+    def enforce_cap(self) -> None:
+        """Evict least recently used sources until the store fits the size cap, then compact"""
+        if self.disk_bytes() <= self.max_bytes:
+            return
+        target = int(self.max_bytes * CAP_HEADROOM)
+        evicted = 0
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._drop_orphans(conn)
+                live = conn.execute("SELECT COALESCE(SUM(length), 0) FROM blobs").fetchone()[0]
+                sources = conn.execute("SELECT source FROM sources ORDER BY last_access").fetchall()
+                for (source,) in sources:
+                    if live <= target:
+                        break
+                    conn.execute("DELETE FROM sources WHERE source = ?", (source,))
+                    evicted += 1
+                    self._drop_orphans(conn)
+                    live = conn.execute("SELECT COALESCE(SUM(length), 0) FROM blobs").fetchone()[0]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if evicted:
+            print(f"Document store over its {self.max_bytes} byte cap, evicted {evicted} least recently used source(s)")
+        # Reclaim every dead byte so the store ends up under the cap, not just the mostly-dead segments
+        self.compact(dead_share=0.0)
+
+    def compact(self, dead_share: float = COMPACT_DEAD_SHARE) -> int:
+        """
+        Rewrite segments whose share of unreferenced bytes is at least dead_share into new segments.
+
+        Returns:
+            Bytes reclaimed on disk
+        """
+        written = 0
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._drop_orphans(conn)
+                sizes = self._segments()
+                if not sizes:
+                    conn.execute("COMMIT")
+                    return 0
+                active = max(sizes)
+                live = dict(conn.execute("SELECT segment, SUM(length) FROM blobs GROUP BY segment").fetchall())
+                # The active segment is included: appends wait on this transaction, and output goes past it
+                victims = [
+                    s for s, size in sizes.items()
+                    if size > live.get(s, 0) and (size - live.get(s, 0)) / size >= dead_share
+                ]
+                if not victims:
+                    conn.execute("COMMIT")
+                    return 0
+
+                # Live records move into fresh segments past the newest one, so appends keep going to the newest file
+                target, offset = active + 1, 0
+                out = open(self._segment_path(target), "ab")
+                try:
+                    for segment in victims:
+                        rows = conn.execute(
+                            "SELECT hash, offset, length FROM blobs WHERE segment = ? ORDER BY offset", (segment,)
+                        ).fetchall()
+                        with open(self._segment_path(segment), "rb") as f:
+                            for key, old_offset, length in rows:
+                                if offset and offset + length > self.segment_bytes:
+                                    out.close()
+                                    target, offset = target + 1, 0
+                                    out = open(self._segment_path(target), "ab")
+                                f.seek(old_offset)
+                                out.write(f.read(length))
+                                conn.execute(
+                                    "UPDATE blobs SET segment = ?, offset = ? WHERE hash = ?", (target, offset, key)
+                                )
+                                offset += length
+                                written += length
+                    out.flush()
+                    os.fsync(out.fileno())
+                finally:
+                    out.close()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        for segment in victims:
+            self._unmap(segment)
+            try:
+                os.remove(self._segment_path(segment))
+            except OSError as e:
+                print(f"Could not remove compacted segment {segment}: {e}")
+        return sum(sizes[s] for s in victims) - written
+
+
+_stores: Dict[str, DocStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_doc_store(path: str) -> DocStore:
+    """Process-wide store per path, so segment maps are shared by all runs in the process"""
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = DocStore(path)
+        return _stores[path]
@@ -1,5 +1,5 @@
 from agent.services.rag_agent import RagResult
-from llm_model import _make_llm_with_structure
+from llm_model import StructuredLLM
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
 from typing import List
@@ -12,7 +12,7 @@ class StrategicInsight(BaseModel):
 class AllStrategicInsights(BaseModel):
     insights: List[StrategicInsight]
 
-_llm_structure = _make_llm_with_structure(AllStrategicInsights, "gpt-5-nano",0.7)
+_llm_structure = StructuredLLM(AllStrategicInsights, "gpt-5-nano", 0.7)
 
 INSIGHTS_PROMPT = ChatPromptTemplate.from_template("""
     Merge, deduplicate and synthesize the following insights
@@ -27,7 +27,21 @@ INSIGHTS_PROMPT = ChatPromptTemplate.from_template("""
 
 
 def insights_agent(raw_insights: RagResult) -> AllStrategicInsights:
-    raw_insights = RagResult(**raw_insights.model_dump())
-    chain = INSIGHTS_PROMPT | _llm_structure
-    res = chain.invoke({"insights": "\n".join(raw_insights.content)})
-    return AllStrategicInsights(**res)
\ No newline at end of file
+    return _llm_structure.invoke(
+        INSIGHTS_PROMPT,
+        {"insights": "\n".join(raw_insights.content)},
+        min_items=min(5, len(raw_insights.content)),
+        id_field="insight_id"
+    )
+
+
+def chunk_insights(raw_insights: RagResult, limit: int = 5) -> AllStrategicInsights:
+    # Single-shot fallback: pass the top retrieved chunks on as insights without an LLM synthesis call
+    return AllStrategicInsights(insights=[
+        StrategicInsight(
+            insight_id=f"chunk-{idx}",
+            key_insight_content=chunk,
+            strategic_relevance="Top retrieved evidence, used directly because insight synthesis was skipped"
+        )
+        for idx, chunk in enumerate(raw_insights.content[:limit], 1)
+    ])
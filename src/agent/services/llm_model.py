@@ -1,28 +1,358 @@
+import contextvars
+import json
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type
+from pydantic import BaseModel, ValidationError, computed_field
+from langchain_core.callbacks import BaseCallbackHandler, BaseCallbackManager, UsageMetadataCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+from langchain_core.prompt_values import PromptValue
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda, ensure_config
+from langchain_core.utils.json import parse_partial_json
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from env_utils import OPENAI_API_KEY, OPENAI_BASE_URL
+from agent.services.resilience import SERVICE_POLICIES, get_guard
+
+
+class _GuardedEmbeddings(Embeddings):
+    """Routes embedding requests through the openai_embedding service guard"""
+
+    def __init__(self, embeddings: Embeddings):
+        self._embeddings = embeddings
+
+    # The guard is looked up per call: share_limits() replaces the guards in worker processes,
+    # after module-level clients may already have been built
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return get_guard("openai_embedding").call(self._embeddings.embed_documents, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return get_guard("openai_embedding").call(self._embeddings.embed_query, text)
+
+
+def _guard_runnable(runnable: Runnable) -> Runnable:
+    # Looked up per call like _GuardedEmbeddings; the config carries callbacks on to the wrapped model
+    return RunnableLambda(lambda x, config: get_guard("openai_chat").call(runnable.invoke, x, config))
+
+
+def usage_config(handler: BaseCallbackHandler) -> RunnableConfig:
+    """
+    Config that adds handler to the callbacks inherited from the calling runnable (e.g. a graph node).
+
+    Pass a UsageMetadataCallbackHandler per node or request to count its tokens; unlike
+    get_usage_metadata_callback() it registers no process-wide hook.
+    """
+    inherited = ensure_config().get("callbacks")
+    if isinstance(inherited, BaseCallbackManager):
+        manager = inherited.copy()
+        manager.add_handler(handler, inherit=True)
+        return {"callbacks": manager}
+    return {"callbacks": [*(inherited or []), handler]}
+
 
 def _embed_model(model: str):
-    return OpenAIEmbeddings(model=model,
+    # Retries and timeouts are owned by the resilience layer, not the client
+    return _GuardedEmbeddings(OpenAIEmbeddings(model=model,
                             api_key = OPENAI_API_KEY,
-                            base_url = OPENAI_BASE_URL)
+                            base_url = OPENAI_BASE_URL,
+                            request_timeout = SERVICE_POLICIES["openai_embedding"].timeout,
+                            max_retries = 0))
 
 
-def _make_llm(model: str,temperature: float):
+def _make_chat_model(model: str, temperature: float) -> ChatOpenAI:
     return ChatOpenAI(
         model=model,
         temperature=temperature,
         api_key=OPENAI_API_KEY,
         base_url=OPENAI_BASE_URL,
+        timeout=SERVICE_POLICIES["openai_chat"].timeout,
+        max_retries=0,
     )
 
 
+def estimate_tokens(text: str) -> int:
+    # Rough OpenAI tokenizer average of four characters per token, good enough for budgeting
+    return len(text) // 4 + 1
+
+
+def _make_llm(model: str,temperature: float):
+    return _guard_runnable(_make_chat_model(model, temperature))
+
+
 def _make_llm_with_structure(schema, model: str,temperature: float):
-    return ChatOpenAI(
-        model=model,
-        temperature=temperature,
-        api_key=OPENAI_API_KEY,
-        base_url=OPENAI_BASE_URL,
-    ).with_structured_output(schema)
+    return _guard_runnable(_make_chat_model(model, temperature).with_structured_output(schema))
+
+
+class StructuredCallStats(BaseModel):
+    """Per-model counters for structured calls, to compare how often models need repairs and what they cost"""
+
+    calls: int = 0
+    fast_path: int = 0  # First response validated as a whole and was complete
+    repaired_calls: int = 0  # Calls that needed at least one repair request
+    failed_calls: int = 0  # Calls still missing items after the last repair
+    invalid_items: int = 0  # Items dropped for failing validation, across first responses and repairs
+    missing_items: int = 0  # Items the first response did not deliver valid
+    repair_requests: int = 0
+    repaired_items: int = 0
+    tokens: int = 0
+    repair_tokens: int = 0
+
+    # Computed fields are serialized too, so job results and reports can compare models directly
+    @computed_field
+    @property
+    def failure_rate(self) -> float:
+        """Share of calls whose first response was not usable as is"""
+        return 1 - self.fast_path / self.calls if self.calls else 0.0
+
+    @computed_field
+    @property
+    def repair_token_share(self) -> float:
+        return self.repair_tokens / self.tokens if self.tokens else 0.0
+
+
+_COUNTERS = list(StructuredCallStats.model_fields)
+
+_structured_stats: Dict[str, StructuredCallStats] = {}
+_structured_stats_lock = threading.Lock()
+# Counters of the calls made inside collect_structured_stats(), on top of the process totals
+_run_stats: contextvars.ContextVar[Optional[Dict[str, StructuredCallStats]]] = contextvars.ContextVar(
+    "structured_run_stats", default=None
+)
+
+
+def structured_call_stats() -> Dict[str, StructuredCallStats]:
+    """Snapshot of the structured-call counters of this process, by model"""
+    with _structured_stats_lock:
+        return {model: stats.model_copy() for model, stats in _structured_stats.items()}
+
+
+@contextmanager
+def collect_structured_stats() -> Iterator[Dict[str, StructuredCallStats]]:
+    """Count the structured calls made in this context separately, e.g. for one pipeline node"""
+    stats: Dict[str, StructuredCallStats] = {}
+    token = _run_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _run_stats.reset(token)
+
+
+def merge_structured_stats(
+    left: Dict[str, StructuredCallStats],
+    right: Dict[str, StructuredCallStats]
+) -> Dict[str, StructuredCallStats]:
+    """Sum two sets of counters by model; the reducer of the per-run structured_stats state key"""
+    merged = {model: stats.model_copy() for model, stats in (left or {}).items()}
+    for model, stats in (right or {}).items():
+        if model not in merged:
+            merged[model] = stats.model_copy()
+            continue
+        for name in _COUNTERS:
+            setattr(merged[model], name, getattr(merged[model], name) + getattr(stats, name))
+    return merged
+
+
+def _record(model: str, **increments: int) -> None:
+    run_stats = _run_stats.get()
+    with _structured_stats_lock:
+        for totals in (_structured_stats, run_stats):
+            if totals is None:
+                continue
+            stats = totals.setdefault(model, StructuredCallStats())
+            for name, value in increments.items():
+                setattr(stats, name, getattr(stats, name) + value)
+
+
+REPAIR_PROMPT = ChatPromptTemplate.from_template("""
+    Your previous answer to the request below was incomplete or did not match the required schema.
+
+    Request:
+    {request}
+
+    Items already accepted, do not repeat them:
+    {accepted}
+
+    Problems found:
+    {problems}
+
+    Return ONLY {missing}, each strictly matching the schema.
+    """)
+
+
+def _raw_payload(raw: Optional[AIMessage]) -> Any:
+    """Best-effort JSON payload of a structured response, tolerating truncated output"""
+    if raw is None:
+        return None
+    if raw.tool_calls:
+        return raw.tool_calls[0]["args"]
+    content = raw.content
+    if isinstance(content, list):
+        content = "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    try:
+        return parse_partial_json(content) if content else None
+    except json.JSONDecodeError:
+        # Not JSON at all, e.g. a refusal in prose; treated like a response with no items
+        return None
+
+
+class StructuredLLM:
+    """
+    Structured-output calls that keep the valid items of a partially valid response.
+
+    The schema is a container model with a single list field (e.g. AllStrategicInsights.insights).
+    The fast path is one native structured-output call whose result validates as a whole. When it
+    does not, each item is validated on its own, valid ones are kept, and only the missing or
+    invalid items are asked for again with a repair prompt.
+    """
+
+    def __init__(self, schema: Type[BaseModel], model: str, temperature: float, max_repairs: int = 2):
+        list_fields = [name for name, field in schema.model_fields.items() if getattr(field.annotation, "__origin__", None) is list]
+        if len(list_fields) != 1:
+            raise ValueError(f"{schema.__name__} must have exactly one list field, found {list_fields}")
+        self.schema = schema
+        self.model = model
+        self.max_repairs = max_repairs
+        self._field = list_fields[0]
+        self._item_schema: Type[BaseModel] = schema.model_fields[self._field].annotation.__args__[0]
+        self._llm = _guard_runnable(
+            _make_chat_model(model, temperature).with_structured_output(schema, include_raw=True)
+        )
+
+    def _request(self, prompt_value: PromptValue) -> Tuple[Dict[str, Any], int]:
+        cb = UsageMetadataCallbackHandler()
+        out = self._llm.invoke(prompt_value, config=usage_config(cb))
+        return out, sum(usage.get("total_tokens", 0) for usage in cb.usage_metadata.values())
+
+    def _validate_items(self, out: Dict[str, Any]) -> Tuple[List[BaseModel], List[str]]:
+        """Valid items of a response, and what was wrong with the rest"""
+        if out.get("parsed") is not None:
+            return list(getattr(out["parsed"], self._field)), []
+
+        payload = _raw_payload(out.get("raw"))
+        if isinstance(payload, dict):
+            payload = payload.get(self._field)
+        if not isinstance(payload, list):
+            return [], [f"Response has no '{self._field}' list: {out.get('parsing_error')}"]
+
+        items, problems = [], []
+        for idx, raw_item in enumerate(payload):
+            try:
+                items.append(self._item_schema.model_validate(raw_item))
+            except ValidationError as e:
+                errors = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+                problems.append(f"Item {idx} is invalid: {errors}")
+        return items, problems
+
+    def invoke(
+        self,
+        prompt: ChatPromptTemplate,
+        inputs: Dict[str, Any],
+        min_items: int = 1,
+        id_field: Optional[str] = None,
+        expected_ids: Optional[List[str]] = None
+    ) -> BaseModel:
+        """
+        Run prompt with inputs and return a validated schema instance.
+
+        Args:
+            prompt: Prompt template producing the request
+            inputs: Template variables
+            min_items: Items the response must contain to be complete
+            id_field: Item field identifying items; duplicates are dropped
+            expected_ids: Ids the response must cover, e.g. one content per insight_id
+
+        Returns:
+            Instance of the schema; items still missing after the last repair are left out
+
+        Raises:
+            ValueError: If no valid item was produced at all
+        """
+        if expected_ids is not None:
+            expected_ids = list(dict.fromkeys(expected_ids))
+        prompt_value = prompt.invoke(inputs)
+        out, tokens = self._request(prompt_value)
+        items, problems = self._validate_items(out)
+        _record(self.model, calls=1, tokens=tokens, invalid_items=len(problems))
+
+        accepted: Dict[str, BaseModel] = {}
+        unkeyed: List[BaseModel] = []
+
+        def accept(candidates: List[BaseModel], limit: Optional[int] = None) -> int:
+            added = 0
+            for item in candidates:
+                if limit is not None and added >= limit:
+                    break
+                if id_field is None:
+                    unkeyed.append(item)
+                    added += 1
+                    continue
+                key = str(getattr(item, id_field))
+                if key in accepted or (expected_ids is not None and key not in expected_ids):
+                    continue
+                accepted[key] = item
+                added += 1
+            return added
+
+        def missing() -> Tuple[int, List[str]]:
+            if expected_ids is not None:
+                ids = [i for i in expected_ids if i not in accepted]
+                return len(ids), ids
+            return max(min_items - len(accepted) - len(unkeyed), 0), []
+
+        accept(items)
+        count, ids = missing()
+        if count == 0:
+            # Invalid extras beyond what was asked for are dropped without a repair
+            if not problems:
+                _record(self.model, fast_path=1)
+            return self._result(accepted, unkeyed, expected_ids)
 
+        _record(self.model, repaired_calls=1, missing_items=count)
+        for _ in range(self.max_repairs):
+            if ids:
+                wanted = f"the {count} missing item(s) with {id_field} in {ids}"
+            elif id_field:
+                wanted = f"{count} more item(s) with new {id_field} values"
+            else:
+                wanted = f"{count} more item(s)"
+            if expected_ids is not None:
+                done = json.dumps(list(accepted))
+            else:
+                # Without expected ids the model can only avoid repeats by seeing what it already said
+                done = json.dumps([item.model_dump(mode="json") for item in [*accepted.values(), *unkeyed]])
+            repair_value = REPAIR_PROMPT.invoke({
+                "request": prompt_value.to_string(),
+                "accepted": done,
+                "problems": "\n".join(problems) or f"{count} item(s) missing",
+                "missing": wanted
+            })
+            out, tokens = self._request(repair_value)
+            items, problems = self._validate_items(out)
+            # Only what was asked for; expected ids already bound a keyed repair
+            added = accept(items, limit=None if expected_ids is not None else count)
+            _record(
+                self.model,
+                repair_requests=1,
+                repaired_items=added,
+                invalid_items=len(problems),
+                tokens=tokens,
+                repair_tokens=tokens
+            )
+            count, ids = missing()
+            if count == 0:
+                break
 
+        if count:
+            _record(self.model, failed_calls=1)
+            print(f"Structured output from {self.model} still missing {count} {self._field} item(s) after repairs")
+        if not accepted and not unkeyed:
+            raise ValueError(f"No valid {self._field} in structured output from {self.model}")
+        return self._result(accepted, unkeyed, expected_ids)
 
+    def _result(self, accepted: Dict[str, BaseModel], unkeyed: List[BaseModel], expected_ids: Optional[List[str]]) -> BaseModel:
+        if expected_ids is not None:
+            items = [accepted[i] for i in expected_ids if i in accepted]
+        else:
+            items = list(accepted.values()) + unkeyed
+        return self.schema(**{self._field: items})
@@ -1,20 +1,35 @@
+import os
 from pdfminer.high_level import extract_pages
 from pdfminer.layout import LTTextContainer
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel, Field
+from agent.services.doc_store import DocStore
 
 
 class LocalDocResult(BaseModel):
     title: str = Field(..., description="The title of the local document")
-    content: str = Field(..., description="The main body content extracted from the local document")
+    content: str = Field("", description="The main body content extracted from the local document, empty when kept in the document store")
+    content_hash: Optional[str] = Field(None, description="Key of the content in the document store, read lazily instead of content")
 
 class AllLocalDocResults(BaseModel):
     results: List[LocalDocResult] = Field(default_factory=list)
 
 
-def extract_text_from_pdf(filename, page_numbers=None, min_line_length=10) -> AllLocalDocResults:
+def extract_text_from_pdf(filename, page_numbers=None, min_line_length=10, store: Optional[DocStore] = None) -> AllLocalDocResults:
     output_results = AllLocalDocResults()
-    
+
+    # The same file parsed with the same options is reused from the document store until it changes on disk
+    if store is not None:
+        pages = ",".join(map(str, sorted(page_numbers))) if page_numbers is not None else "all"
+        source = f"{os.path.abspath(filename)}#pages={pages}&min_line_length={min_line_length}"
+        stat = os.stat(filename)
+        fingerprint = f"{stat.st_size}:{stat.st_mtime_ns}"
+        stored = store.get_source(source)
+        if stored is not None and stored.fingerprint == fingerprint:
+            output_results.results.append(LocalDocResult(title=filename, content_hash=stored.cleaned_hash))
+            return output_results
+
+    raw_lines = []
     valid_lines = []
 
     for i, page_layout in enumerate(extract_pages(filename)):
@@ -24,6 +39,8 @@ def extract_text_from_pdf(filename, page_numbers=None, min_line_length=10) -> Al
         for element in page_layout:
             if isinstance(element, LTTextContainer):
                 for text_line in element.get_text().split('\n'):
+                    if store is not None:
+                        raw_lines.append(text_line)
                     clean_text = text_line.strip()
                     
                     if len(clean_text) >= min_line_length:
@@ -34,7 +51,12 @@ def extract_text_from_pdf(filename, page_numbers=None, min_line_length=10) -> Al
 
     full_content = "".join(valid_lines).strip()
 
-    if full_content:
+    if full_content and store is not None:
+        stored = store.put_source(source, "pdf", filename, "\n".join(raw_lines), full_content, fingerprint=fingerprint)
+        output_results.results.append(
+            LocalDocResult(title=filename, content_hash=stored.cleaned_hash)
+        )
+    elif full_content:
         output_results.results.append(
             LocalDocResult(title=filename, content=full_content)
         )
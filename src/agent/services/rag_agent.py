@@ -1,65 +1,96 @@
 import shutil
 import os
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel, Field
 
-from agent.services.search_doc_load import AllSearchDocResults 
-from agent.services.local_doc_load import AllLocalDocResults
+from agent.services.search_doc_load import AllSearchDocResults, SearchDocResult
+from agent.services.local_doc_load import AllLocalDocResults, LocalDocResult
+from agent.services.doc_store import DocStore
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores.chroma import Chroma
 from llm_model import _embed_model
 
+COLLECTION_NAME = "openai_embedding"
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBED_BATCH_SIZE = 256
+# Retrieval parameters; `python -m agent.benchmark` sweeps them offline
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 50
+TOP_K = 50
+RELEVANCE_THRESHOLD = 0.5
+
 class RagResult(BaseModel):
     content: List[str] = Field(..., description="The similar content list")
 
-def map_agent(input_docs: AllSearchDocResults | AllLocalDocResults, db_path: str) -> Chroma:
-    langchain_docs = [
-        Document(page_content=res.content, metadata={"title": res.title}) 
-        for res in input_docs.results
-    ]
-    
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=50)
-    split_docs = text_splitter.split_documents(langchain_docs)
-    
-    embedding_func = _embed_model(model='text-embedding-ada-002')
-    
-    return Chroma.from_documents(
-        documents=split_docs, 
-        embedding=embedding_func, 
-        collection_name="openai_embedding", 
+def reset_vector_store(db_path: str) -> None:
+
+    if os.path.exists(db_path):
+        try:
+            shutil.rmtree(db_path)
+        except PermissionError:
+            print(f"Warning: Directory {db_path} is in use, attempting to continue...")
+
+def init_vector_store(db_path: str) -> None:
+    """Create the collection up front; Chroma's client setup for a path is not thread-safe, so loaders running concurrently must only open it"""
+    Chroma(
+        collection_name=COLLECTION_NAME,
         persist_directory=db_path,
         collection_metadata={"hnsw:space": "cosine"}
     )
 
-def search_with_threshold(vectorstore, query, threshold=0.5):
+def document_text(res: SearchDocResult | LocalDocResult, store: Optional[DocStore] = None) -> str:
+    """Content of a loaded document, read from the document store when only its hash was kept"""
+    if res.content or not res.content_hash:
+        return res.content
+    if store is None:
+        raise ValueError(f"{res.title} is kept in the document store, but no store was given")
+    return store.get_text(res.content_hash)
 
-    results_with_scores = vectorstore.similarity_search_with_relevance_scores(query, k=50)
-    return [doc for doc, score in results_with_scores if score >= threshold]
+def map_agent(
+    input_docs: AllSearchDocResults | AllLocalDocResults,
+    db_path: str,
+    store: Optional[DocStore] = None,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    embedding: Optional[Embeddings] = None
+) -> Optional[Chroma]:
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    vectorstore = None
 
-def reduce_agent(input_docs_1: AllSearchDocResults, input_docs_2: AllLocalDocResults, db_path: str) -> RagResult:
+    # Split one document at a time and embed in fixed-size batches, so a large PDF
+    # never holds every chunk's embedding vector in memory at once; documents kept in
+    # the store are only read from its mmap when their turn comes
+    for res in input_docs.results:
+        split_docs = text_splitter.split_documents(
+            [Document(page_content=document_text(res, store), metadata={"title": res.title})]
+        )
+        for start in range(0, len(split_docs), EMBED_BATCH_SIZE):
+            # Documents are indexed one by one as they arrive, so the store is only opened once there is a chunk
+            if vectorstore is None:
+                vectorstore = Chroma(
+                    collection_name=COLLECTION_NAME,
+                    embedding_function=embedding or _embed_model(model=EMBEDDING_MODEL),
+                    persist_directory=db_path,
+                    collection_metadata={"hnsw:space": "cosine"}
+                )
+            vectorstore.add_documents(split_docs[start:start + EMBED_BATCH_SIZE])
 
-    if not input_docs_1.results and not input_docs_2.results:
-        return RagResult(content=[])
-        
-    query = input_docs_1.results[0].query if input_docs_1.results else "default query"
+    return vectorstore
 
-    if os.path.exists(db_path):
-        try:
-            shutil.rmtree(db_path)
-        except PermissionError:
-            print(f"Warning: Directory {db_path} is in use, attempting to continue...")
+def search_with_threshold(vectorstore, query, threshold=RELEVANCE_THRESHOLD, k=TOP_K):
 
-    map_agent(input_docs_1, db_path)
-    map_agent(input_docs_2, db_path)
+    results_with_scores = vectorstore.similarity_search_with_relevance_scores(query, k=k)
+    return [doc for doc, score in results_with_scores if score >= threshold]
+
+def retrieve_agent(query: str, db_path: str) -> RagResult:
 
     vectorstore = Chroma(
         persist_directory=db_path, 
-        embedding_function=_embed_model(model='text-embedding-ada-002'),
-        collection_name="openai_embedding"
+        embedding_function=_embed_model(model=EMBEDDING_MODEL),
+        collection_name=COLLECTION_NAME
     )
     
-    docs = search_with_threshold(vectorstore, query, threshold=0.5)
+    docs = search_with_threshold(vectorstore, query)
     return RagResult(content=[d.page_content for d in docs])
-
-      
@@ -0,0 +1,267 @@
+import contextvars
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+from pydantic import BaseModel, Field
+import requests
+
+T = TypeVar("T")
+
+
+class ServicePolicy(BaseModel):
+    max_concurrency: int = Field(4, description="Maximum in-flight calls to the service")
+    rate_per_second: float = Field(5.0, description="Token-bucket refill rate")
+    burst: int = Field(5, description="Token-bucket capacity")
+    timeout: float = Field(30.0, description="Per-request timeout in seconds, passed to the client")
+    max_retries: int = Field(3, description="Retries after the first attempt, 0 disables retrying")
+    backoff_base: float = Field(0.5, description="Base delay in seconds for exponential backoff")
+    backoff_max: float = Field(8.0, description="Upper bound for a single backoff delay")
+    failure_threshold: int = Field(5, description="Consecutive failures before the circuit opens")
+    reset_timeout: float = Field(30.0, description="Seconds the circuit stays open before a trial call")
+    hedge_after: Optional[float] = Field(None, description="Send a duplicate request if no reply after this many seconds")
+
+
+# Single place to tune how the pipeline talks to external services.
+# Only idempotent calls may be hedged, and publishing is never retried to avoid duplicate posts.
+SERVICE_POLICIES: Dict[str, ServicePolicy] = {
+    "serpapi": ServicePolicy(max_concurrency=2, rate_per_second=1.0, burst=2, timeout=20.0),
+    "web": ServicePolicy(max_concurrency=8, rate_per_second=4.0, burst=8, timeout=15.0, max_retries=2),
+    "openai_chat": ServicePolicy(max_concurrency=4, rate_per_second=3.0, burst=5, timeout=120.0, hedge_after=45.0),
+    "openai_embedding": ServicePolicy(max_concurrency=4, rate_per_second=5.0, burst=10, timeout=60.0),
+    "facebook_publish": ServicePolicy(max_concurrency=1, rate_per_second=0.5, burst=1, timeout=15.0, max_retries=0),
+    "facebook_insights": ServicePolicy(max_concurrency=4, rate_per_second=2.0, burst=4, timeout=10.0),
+}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a service's circuit breaker is rejecting calls"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a guarded call would run past the deadline set with call_deadline"""
+
+
+# Absolute wall-clock time (time.time()) no guarded call may run past, None for no deadline
+_call_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("call_deadline", default=None)
+
+
+@contextmanager
+def call_deadline(deadline: Optional[float]) -> Iterator[None]:
+    """Bound every guarded call made in this context, including its retries and backoff, by deadline"""
+    token = _call_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _call_deadline.reset(token)
+
+
+def call_timeout(service: str) -> float:
+    """Per-request client timeout for a service, shortened to what is left before the call deadline"""
+    timeout = SERVICE_POLICIES[service.split(":", 1)[0]].timeout
+    deadline = _call_deadline.get()
+    return timeout if deadline is None else max(min(timeout, deadline - time.time()), 0.1)
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a token is available"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open trial call"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self, name: str) -> None:
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError(f"Circuit for {name} is open, skipping call")
+                self.state = "half_open"
+            elif self.state == "half_open":
+                raise CircuitOpenError(f"Circuit for {name} is half open, trial call in progress")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, CircuitOpenError):
+        return False
+    # Client errors will fail the same way again, except timeouts and rate limiting
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int) and 400 <= status < 500 and status not in (408, 429):
+        return False
+    return True
+
+
+class ServiceGuard:
+    """Applies a ServicePolicy (concurrency, rate limit, retries, circuit breaker, hedging) to calls"""
+
+    def __init__(self, name: str, policy: ServicePolicy):
+        self.name = name
+        self.policy = policy
+        self._semaphore = threading.BoundedSemaphore(policy.max_concurrency)
+        self._bucket = TokenBucket(policy.rate_per_second, policy.burst)
+        self.breaker = CircuitBreaker(policy.failure_threshold, policy.reset_timeout)
+
+    def call(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        deadline = _call_deadline.get()
+        for attempt in range(self.policy.max_retries + 1):
+            if deadline is not None and time.time() >= deadline:
+                raise DeadlineExceeded(f"Deadline reached before calling {self.name}")
+            self.breaker.before_call(self.name)
+            try:
+                result = self._attempt(deadline, fn, *args, **kwargs)
+            except DeadlineExceeded:
+                # Too slow to finish in time counts against the service, and there is no time left to retry
+                self.breaker.record_failure()
+                raise
+            except Exception as e:
+                retryable = _is_retryable(e)
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if not retryable or attempt == self.policy.max_retries:
+                    raise
+                # Full jitter keeps concurrent callers from retrying in lockstep
+                delay = random.uniform(0, min(self.policy.backoff_max, self.policy.backoff_base * 2 ** attempt))
+                if deadline is not None and time.time() + delay >= deadline:
+                    raise
+                print(f"{self.name} call failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+        raise RuntimeError("unreachable")
+
+    def _invoke(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        with self._semaphore:
+            self._bucket.acquire()
+            return fn(*args, **kwargs)
+
+    def _attempt(self, deadline: Optional[float], fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        if self.policy.hedge_after is None and deadline is None:
+            return self._invoke(fn, *args, **kwargs)
+
+        executor = ThreadPoolExecutor(max_workers=2)
+
+        def submit() -> Future:
+            # Run in a copy of the caller's context so LangChain callbacks such as token tracking still see the call
+            return executor.submit(contextvars.copy_context().run, self._invoke, fn, *args, **kwargs)
+
+        try:
+            pending = {submit()}
+            hedge_at = None if self.policy.hedge_after is None else time.time() + self.policy.hedge_after
+
+            # Return the first successful reply; only fail once every request has failed or the deadline passed
+            error: Optional[BaseException] = None
+            while pending:
+                waits = [t - time.time() for t in (hedge_at, deadline) if t is not None]
+                done, pending = wait(pending, timeout=max(min(waits), 0) if waits else None, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+                    error = future.exception()
+                if done:
+                    continue
+                if deadline is not None and time.time() >= deadline:
+                    raise DeadlineExceeded(f"{self.name} call did not finish before the deadline")
+                if hedge_at is not None and time.time() >= hedge_at:
+                    print(f"{self.name} call slower than {self.policy.hedge_after}s, sending hedged request")
+                    pending.add(submit())
+                    hedge_at = None
+            assert error is not None
+            raise error
+        finally:
+            # Do not wait for the losing or abandoned request
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_guards: Dict[str, ServiceGuard] = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(service: str) -> ServiceGuard:
+    """
+    Shared guard of a service.
+
+    "service:key" (e.g. "web:example.com") gets its own guard with the service's policy, so one
+    failing host opens only its own circuit instead of the whole service's.
+    """
+    with _guards_lock:
+        if service not in _guards:
+            _guards[service] = ServiceGuard(service, SERVICE_POLICIES[service.split(":", 1)[0]])
+        return _guards[service]
+
+
+def share_limits(processes: int) -> None:
+    """
+    Split each service's rate and concurrency limits evenly across processes that call it at once.
+
+    Called in every worker process before its first guarded call, so N workers together stay within the
+    configured limits. Concurrency cannot drop below one call per process.
+    """
+    for name, policy in SERVICE_POLICIES.items():
+        SERVICE_POLICIES[name] = policy.model_copy(update={
+            "max_concurrency": max(policy.max_concurrency // processes, 1),
+            "rate_per_second": policy.rate_per_second / processes,
+            "burst": max(policy.burst // processes, 1),
+        })
+    with _guards_lock:
+        _guards.clear()
+
+
+def guarded_call(service: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    return get_guard(service).call(fn, *args, **kwargs)
+
+
+def _checked_request(method: str, url: str, **kwargs: Any) -> requests.Response:
+    resp = requests.request(method, url, **kwargs)
+    resp.raise_for_status()
+    return resp
+
+
+def http_request(service: str, method: str, url: str, **kwargs: Any) -> requests.Response:
+    # raise_for_status runs inside the guard so 5xx replies count as failures and are retried
+    kwargs.setdefault("timeout", call_timeout(service))
+    return guarded_call(service, _checked_request, method, url, **kwargs)
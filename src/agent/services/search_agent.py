@@ -2,6 +2,7 @@ from typing import List, Optional
 from pydantic import BaseModel, Field
 from serpapi import GoogleSearch
 from env_utils import SERPAPI_API_KEY
+from agent.services.resilience import SERVICE_POLICIES, guarded_call
 
 class SearchResult(BaseModel):
     query: str = Field(..., description="The search query")
@@ -27,8 +28,9 @@ def google_search(query: str) -> AllSearchResults:
         "num": 10,
         "api_key": SERPAPI_API_KEY
     })
+    search.timeout = SERVICE_POLICIES["serpapi"].timeout
     
-    res = search.get_dict()
+    res = guarded_call("serpapi", search.get_dict)
     news_items = res.get("news_results", [])
 
     if not news_items:
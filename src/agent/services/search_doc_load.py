@@ -1,53 +1,110 @@
 from langchain_community.document_loaders import WebBaseLoader
 from pydantic import BaseModel, Field
-from typing import List
+import time
+from typing import Callable, List, Optional
+from urllib.parse import urlparse
 from agent.services.search_agent import AllSearchResults
+from agent.services.resilience import call_timeout, guarded_call
+from agent.services.doc_store import WEB_MAX_AGE_SECONDS, DocStore
 
 
 class SearchDocResult(BaseModel):
     title: str = Field(..., description="The title of the search result")
-    content: str = Field(..., description="The main body content re-edited from the crawled webpage by llm")
+    content: str = Field("", description="The main body content re-edited from the crawled webpage by llm, empty when kept in the document store")
+    content_hash: Optional[str] = Field(None, description="Key of the content in the document store, read lazily instead of content")
+    llm_cleaned: bool = Field(True, description="False when LLM cleanup was skipped to stay within the token budget")
 
 
 class AllSearchDocResults(BaseModel):
     results: List[SearchDocResult] = Field(default_factory=list)
+    failed_links: List[str] = Field(default_factory=list, description="Links skipped because fetching or cleaning them failed")
 
 
-from llm_model import _make_llm
+from llm_model import _make_llm, estimate_tokens
 from langchain_core.prompts import ChatPromptTemplate
 
-def text_loader(search_results: AllSearchResults) -> AllSearchDocResults:
+def _filter_lines(raw_content: str) -> str:
+    clean_chunk = []
+    for chunk in raw_content.split("\n"):
+        if chunk=='':
+                continue
+        else:
+                chunk = chunk.strip()
+                if len(chunk.split(' ')) < 10:
+                    continue
+                clean_chunk.append(chunk)
+    return "\n\n".join(clean_chunk)
+
+
+def text_loader(
+    search_results: AllSearchResults,
+    on_document: Optional[Callable[[SearchDocResult], None]] = None,
+    stop_at: Optional[float] = None,
+    cleanup_token_limit: Optional[int] = None,
+    store: Optional[DocStore] = None
+) -> AllSearchDocResults:
      
     output_results = AllSearchDocResults()
+    cleanup_tokens = 0
     for result in search_results.results:
+        if stop_at is not None and time.time() >= stop_at:
+            print(f"Deadline reached, stopped crawling after {len(output_results.results)} link(s)")
+            break
+
         link = result.link
         title = result.title
         # description = result.snippet
 
-        loader = WebBaseLoader(link)
-        docs = loader.load()
-        res = docs[0].page_content
-        clean_chunk = []
-        for chunk in res.split("\n"):
-            if chunk=='':
-                    continue
-            else:
-                    chunk = chunk.strip()
-                    if len(chunk.split(' ')) < 10:
-                        continue
-                    clean_chunk.append(chunk)
-        final_content = "\n\n".join(clean_chunk)
-
-        strict_llm = _make_llm("gpt-5-nano", 0.2)
-
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are a Senior Copy Editor specializing in proofreading the text content."),
-            ("human", "The following is raw text extracted from a website. Please filter out noise such as navigation bars, button text, and dates to preserve only the primary body content.\n\nRaw Content: {raw_content}")
-        ])
-        chain = prompt | strict_llm
-        cleaned_content = chain.invoke({"raw_content": final_content})
-        output_results.results.append(SearchDocResult(title=title, content=cleaned_content.content))
+        # Pages crawled recently are reused from the document store: no refetch, and no second LLM cleanup
+        stored = store.get_source(link) if store is not None else None
+        if stored is not None and time.time() - stored.updated_at > WEB_MAX_AGE_SECONDS:
+            stored = None
+        if stored is not None and stored.llm_cleaned:
+            doc = SearchDocResult(title=title, content_hash=stored.cleaned_hash)
+        else:
+            try:
+                if stored is not None:
+                    raw_content = store.get_text(stored.raw_hash)
+                else:
+                    loader = WebBaseLoader(link, requests_kwargs={"timeout": call_timeout("web")})
+                    # One guard per host, so a dead host opens only its own circuit
+                    docs = guarded_call(f"web:{urlparse(link).netloc}", loader.load)
+                    raw_content = docs[0].page_content
+                final_content = _filter_lines(raw_content)
 
-    return output_results
+                # Cleanup echoes the page back, so it costs about twice the page's tokens
+                cleanup_cost = 2 * estimate_tokens(final_content)
+                if cleanup_token_limit is not None and cleanup_tokens + cleanup_cost > cleanup_token_limit:
+                    content, llm_cleaned = final_content, False
+                else:
+                    cleanup_tokens += cleanup_cost
+                    strict_llm = _make_llm("gpt-5-nano", 0.2)
+
+                    prompt = ChatPromptTemplate.from_messages([
+                        ("system", "You are a Senior Copy Editor specializing in proofreading the text content."),
+                        ("human", "The following is raw text extracted from a website. Please filter out noise such as navigation bars, button text, and dates to preserve only the primary body content.\n\nRaw Content: {raw_content}")
+                    ])
+                    chain = prompt | strict_llm
+                    cleaned_content = chain.invoke({"raw_content": final_content})
+                    content, llm_cleaned = cleaned_content.content, True
 
+                if store is None:
+                    doc = SearchDocResult(title=title, content=content, llm_cleaned=llm_cleaned)
+                elif stored is not None and not llm_cleaned:
+                    # Still uncleaned; keep the original fetch time so the page is not kept past its max age
+                    doc = SearchDocResult(title=title, content_hash=stored.cleaned_hash, llm_cleaned=False)
+                else:
+                    stored = store.put_source(link, "web", title, raw_content, content, llm_cleaned=llm_cleaned)
+                    doc = SearchDocResult(title=title, content_hash=stored.cleaned_hash, llm_cleaned=llm_cleaned)
+            except Exception as e:
+                # Skip the link; one unreachable host must not cost the others
+                print(f"Skipping {link}: {str(e)}")
+                output_results.failed_links.append(link)
+                continue
+        output_results.results.append(doc)
 
+        # Hand each page downstream as soon as it is ready, e.g. for incremental embedding
+        if on_document is not None:
+            on_document(doc)
+
+    return output_results
@@ -0,0 +1,293 @@
+import argparse
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, Optional, Set
+from pydantic import BaseModel
+
+from agent.job_queue import (
+    JobQueue,
+    JobRequest,
+    TenantConfig,
+    keep_lease,
+    tenant_access_token,
+    tenant_content_index_path,
+    tenant_db_path,
+    tenant_doc_store_path,
+)
+from agent.review_queue import ReviewItem, ReviewQueue
+from agent.services.resilience import share_limits
+
+# Keys the publishing and analytics steps set when a reviewed job resumes
+_RESUME_KEYS = ("human_approval", "human_feedback", "dedup_report", "publish_results", "analytics_report")
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, dict):
+        return {k: _to_json(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_to_json(v) for v in value]
+    return value
+
+
+def execute_job(queue_path: str, job_id: str) -> str:
+    """
+    Run one claimed job in a worker process, recording each finished node in the queue.
+
+    Args:
+        queue_path: Path of the SQLite job queue
+        job_id: Job previously marked as running by JobQueue.claim_next
+
+    Returns:
+        Final job status
+    """
+    # Imported here since the dispatcher process never runs the graph itself
+    from chromadb.api.shared_system_client import SharedSystemClient
+    from agent.graph import build_initial_state, create_graph
+    from agent.services.rag_agent import reset_vector_store
+
+    queue = JobQueue(queue_path)
+    job = queue.status(job_id)
+    tenant = queue.get_tenant(job.tenant_id)
+    db_path = tenant_db_path(tenant, job_id)
+
+    with keep_lease(lambda: queue.heartbeat(job_id)):
+        try:
+            # Reviews share the job queue's database; a queued review releases this process
+            execution_graph = create_graph(require_human_approval=job.request.require_human_approval)
+            state = build_initial_state(
+                query=job.request.query,
+                local_pdf_path=job.request.local_pdf_path,
+                facebook_page_id=tenant.facebook_page_id,
+                facebook_access_token=tenant_access_token(tenant),
+                db_path=db_path,
+                doc_store_path=tenant_doc_store_path(tenant),
+                content_index_path=tenant_content_index_path(tenant),
+                skip_publishing=job.request.skip_publishing,
+                skip_analytics=job.request.skip_analytics,
+                deadline_seconds=job.request.deadline_seconds,
+                token_budget=job.request.token_budget,
+                require_human_approval=job.request.require_human_approval,
+                review_queue_path=queue_path,
+                job_id=job_id
+            )
+            final_state: Dict[str, Any] = dict(state)
+            for mode, chunk in execution_graph.stream(state, stream_mode=["updates", "values"]):
+                if mode == "values":
+                    final_state = chunk
+                    continue
+                for node in chunk:
+                    queue.record_node(job_id, node, final_state.get("errors", []))
+
+            final_state["elapsed_seconds"] = time.time() - state["started_at"]
+            errors = final_state.get("errors", [])
+            result = _to_json({k: v for k, v in final_state.items() if k != "facebook_access_token"})
+            if final_state.get("human_approval") == "pending":
+                queue.await_review(job_id, result, errors)
+                return "awaiting_review"
+            queue.finish(job_id, result, errors)
+            return "succeeded"
+        except Exception as e:
+            queue.fail(job_id, f"Worker error: {str(e)}")
+            return "failed"
+        finally:
+            # Pool processes are long-lived: drop Chroma's cached client for this job's path with the directory
+            SharedSystemClient.clear_system_cache()
+            reset_vector_store(db_path)
+
+
+def execute_review(queue_path: str, review_id: str) -> str:
+    """
+    Resume an approved review at publishing in a worker process.
+
+    Args:
+        queue_path: Path of the SQLite job queue, which also holds the reviews
+        review_id: Review previously marked as publishing by ReviewQueue.claim_decided
+
+    Returns:
+        Final status of the review's job
+    """
+    from agent.graph import build_resume_state, create_publish_graph, review_outcome
+
+    queue = JobQueue(queue_path)
+    reviews = ReviewQueue(queue_path)
+    item = reviews.get(review_id)
+
+    with keep_lease(lambda: reviews.heartbeat(review_id)):
+        try:
+            # The access token is not kept with the review; use the tenant's current credentials,
+            # which may also have been rotated while the review waited
+            tenant = queue.get_tenant(queue.status(item.job_id).tenant_id) if item.job_id else None
+            state = build_resume_state(item, queue_path, tenant_access_token(tenant) if tenant else None)
+            if tenant is not None:
+                state["facebook_page_id"] = tenant.facebook_page_id
+
+            final_state: Dict[str, Any] = dict(state)
+            for mode, chunk in create_publish_graph().stream(state, stream_mode=["updates", "values"]):
+                if mode == "values":
+                    final_state = chunk
+                    continue
+                if item.job_id:
+                    for node in chunk:
+                        queue.record_node(item.job_id, node, final_state.get("errors", []))
+        except Exception as e:
+            reviews.finish(review_id, "failed")
+            if item.job_id:
+                queue.fail(item.job_id, f"Worker error: {str(e)}")
+            return "failed"
+
+    # Nothing posted is not a success: the review stays retryable and the job reports the failure
+    outcome = review_outcome(item, final_state)
+    reviews.finish(review_id, outcome)
+    status = "failed" if outcome == "failed" else "succeeded"
+    if item.job_id:
+        job = queue.status(item.job_id)
+        result = dict(job.result or {})
+        result.update(_to_json({k: final_state.get(k) for k in _RESUME_KEYS}))
+        if status == "failed":
+            reason = "; ".join(final_state.get("errors", [])) or "no post succeeded"
+            queue.fail(item.job_id, f"Review {review_id} published nothing: {reason}", result=result)
+        else:
+            queue.finish(item.job_id, result, job.errors + final_state.get("errors", []))
+    return status
+
+
+def _close_rejected(queue: JobQueue, item: ReviewItem) -> None:
+    job = queue.status(item.job_id)
+    result = dict(job.result or {})
+    result.update(human_approval="rejected", human_feedback=item.feedback)
+    queue.finish(item.job_id, result, job.errors)
+
+
+def run_worker(
+    queue_path: str,
+    workers: Optional[int] = None,
+    poll_interval: float = 1.0,
+    stop_when_empty: bool = False
+) -> None:
+    """
+    Dispatch queued jobs to a process pool until interrupted.
+
+    Args:
+        queue_path: Path of the SQLite job queue
+        workers: Number of worker processes, defaults to the CPU count
+        poll_interval: Seconds to wait between polls when the queue is idle
+        stop_when_empty: Return once the queue is drained instead of polling forever
+    """
+    workers = workers or os.cpu_count() or 1
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    queue = JobQueue(queue_path)
+    reviews = ReviewQueue(queue_path)
+    print(f"Worker {worker_id} started with {workers} process(es) on {queue_path}")
+    in_flight: Set[Future] = set()
+    # Service limits are per process; each worker gets its share so the pool as a whole stays within them
+    with ProcessPoolExecutor(max_workers=workers, initializer=share_limits, initargs=(workers,)) as pool:
+        while True:
+            # Checked every poll, so jobs of a dispatcher that died are picked up by the ones still running
+            requeued = queue.requeue_stale()
+            if requeued:
+                print(f"Requeued {requeued} job(s) whose worker stopped renewing their lease")
+            requeued = reviews.requeue_stale()
+            if requeued:
+                print(f"Requeued {requeued} approved review(s) whose worker stopped renewing their lease")
+
+            # Claim only as many jobs as there are free processes so fairness is decided at claim time;
+            # decided reviews go first since they only publish and were already waited on by a human
+            while len(in_flight) < workers:
+                review = reviews.claim_decided()
+                if review is not None and review.status == "rejected":
+                    if review.job_id:
+                        _close_rejected(queue, review)
+                    continue
+                if review is not None:
+                    print(f"Dispatching approved review {review.review_id}")
+                    in_flight.add(pool.submit(execute_review, queue_path, review.review_id))
+                    continue
+                job_id = queue.claim_next(worker_id)
+                if job_id is None:
+                    break
+                print(f"Dispatching job {job_id}")
+                in_flight.add(pool.submit(execute_job, queue_path, job_id))
+
+            if not in_flight:
+                if stop_when_empty:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            done, in_flight = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    print(f"There is some worker error: {future.exception()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Multi-tenant worker mode for the marketing pipeline")
+    parser.add_argument("--queue", default="./jobs.sqlite", help="Path of the SQLite job queue")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    tenant_cmd = sub.add_parser("add-tenant", help="Register or update a brand")
+    tenant_cmd.add_argument("tenant_id")
+    tenant_cmd.add_argument("--db-path", required=True)
+    tenant_cmd.add_argument("--facebook-page-id")
+    tenant_cmd.add_argument(
+        "--facebook-access-token-env",
+        help="Environment variable the workers read the brand's FB Page Access Token from"
+    )
+
+    submit_cmd = sub.add_parser("submit", help="Queue a pipeline run for a brand")
+    submit_cmd.add_argument("tenant_id")
+    submit_cmd.add_argument("query")
+    submit_cmd.add_argument("--local-pdf-path")
+    submit_cmd.add_argument("--skip-publishing", action="store_true")
+    submit_cmd.add_argument("--skip-analytics", action="store_true")
+    submit_cmd.add_argument("--deadline-seconds", type=float)
+    submit_cmd.add_argument("--token-budget", type=int)
+    submit_cmd.add_argument(
+        "--require-human-approval", action="store_true",
+        help="Queue content for review; approve with: python -m agent.review_queue --queue <queue> approve <id>"
+    )
+
+    run_cmd = sub.add_parser("run", help="Process queued jobs")
+    run_cmd.add_argument("--workers", type=int)
+    run_cmd.add_argument("--stop-when-empty", action="store_true")
+
+    status_cmd = sub.add_parser("status", help="Show job progress")
+    status_cmd.add_argument("job_id", nargs="?")
+    status_cmd.add_argument("--tenant")
+
+    args = parser.parse_args()
+    queue = JobQueue(args.queue)
+
+    if args.command == "add-tenant":
+        queue.add_tenant(TenantConfig(
+            tenant_id=args.tenant_id,
+            db_path=args.db_path,
+            facebook_page_id=args.facebook_page_id,
+            facebook_access_token_env=args.facebook_access_token_env
+        ))
+        print(f"Tenant {args.tenant_id} saved")
+    elif args.command == "submit":
+        job_id = queue.submit(args.tenant_id, JobRequest(
+            query=args.query,
+            local_pdf_path=args.local_pdf_path,
+            skip_publishing=args.skip_publishing,
+            skip_analytics=args.skip_analytics,
+            deadline_seconds=args.deadline_seconds,
+            token_budget=args.token_budget,
+            require_human_approval=args.require_human_approval
+        ))
+        print(job_id)
+    elif args.command == "run":
+        run_worker(args.queue, workers=args.workers, stop_when_empty=args.stop_when_empty)
+    elif args.command == "status":
+        jobs = [queue.status(args.job_id)] if args.job_id else queue.list_jobs(tenant_id=args.tenant)
+        for job in jobs:
+            print(job.model_dump_json(exclude={"result"}))
+
+
+if __name__ == "__main__":
+    main()
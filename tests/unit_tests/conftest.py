@@ -0,0 +1,4 @@
+import os
+
+# Chat and embedding clients are built at import time; no test talks to OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+from agent import budget
+from agent.services.resilience import _call_deadline
+
+
+def test_unbounded_runs_have_no_limits():
+    state = {"started_at": time.time(), "deadline": None, "token_budget": None, "tokens_used": 100}
+
+    assert budget.time_left(state) is None
+    assert budget.tokens_left(state) is None
+    assert budget.crawl_stop_at(state) is None
+    assert budget.cleanup_token_limit(state) is None
+    assert not budget.use_single_shot(state)
+
+
+@pytest.mark.parametrize("duration, reserve", [(20, 8.0), (100, 40.0), (1000, 90.0)])
+def test_synthesis_reserve_is_a_share_of_the_deadline_capped_in_seconds(duration, reserve):
+    state = {"started_at": 1000.0, "deadline": 1000.0 + duration}
+
+    assert state["deadline"] - budget.crawl_stop_at(state) == pytest.approx(reserve)
+
+
+def test_single_shot_below_either_two_stage_minimum():
+    now = time.time()
+    roomy = {"deadline": now + 600, "token_budget": 100_000, "tokens_used": 0}
+
+    assert not budget.use_single_shot(roomy)
+    assert budget.use_single_shot({**roomy, "deadline": now + budget.TWO_STAGE_MIN_SECONDS - 1})
+    assert budget.use_single_shot({**roomy, "tokens_used": 100_000 - budget.TWO_STAGE_MIN_TOKENS + 1})
+
+
+def test_cleanup_limit_and_truncation_follow_the_token_budget():
+    assert budget.cleanup_token_limit({"token_budget": 10_000}) == 10_000 * budget.CLEANUP_TOKEN_SHARE
+
+    texts = ["a" * 396, "b" * 396, "c" * 396]  # 100 estimated tokens each
+    assert budget.truncate_to_tokens(texts, 250) == texts[:2]
+    assert budget.truncate_to_tokens(texts, 50) == []
+
+
+def test_deadline_bound_nodes_run_under_the_run_deadline():
+    seen = []
+
+    @budget.deadline_bound
+    def node(state):
+        """A node."""
+        seen.append(_call_deadline.get())
+        return {}
+
+    node({"deadline": 123.0})
+    node({"deadline": None})
+
+    assert seen == [123.0, None]
+    assert node.__name__ == "node"
+    assert _call_deadline.get() is None
@@ -0,0 +1,73 @@
+import pytest
+from pydantic import ValidationError
+
+from agent.services.content_generation import AllMarketingContents, MarketingContent
+from agent.services.content_index import ContentIndex, DedupPolicy, dedup_agent, minhash_signature
+
+POST = (
+    "Our spring campaign shows how small retailers use AI assistants to answer customer questions "
+    "around the clock, cut response times in half and turn more first-time visitors into loyal buyers."
+)
+
+
+def _content(insight_id: str, body: str) -> MarketingContent:
+    return MarketingContent(
+        insight_id=insight_id, content_format="Poster", headline="Spring campaign", body_text=body,
+        call_to_action="c", target_audience="a", distribution_channel=["Facebook"], sources=[]
+    )
+
+
+def test_minhash_signature_is_stable_and_estimates_similarity():
+    same = (minhash_signature(POST) == minhash_signature(POST)).mean()
+    near = (minhash_signature(POST) == minhash_signature(POST.replace("half", "half again"))).mean()
+    other = (minhash_signature(POST) == minhash_signature("An unrelated note about quarterly tax filing deadlines.")).mean()
+
+    assert same == 1.0
+    assert near > 0.7
+    assert other < 0.1
+
+
+def test_lookup_finds_near_duplicates_through_lsh_buckets(tmp_path):
+    index = ContentIndex(str(tmp_path))
+    for i in range(50):
+        index.add(f"other{i}", f"Unrelated post number {i} about topic {i * 31} and nothing else in particular")
+    index.add("p1", POST)
+
+    matches = index.lookup(POST.replace("loyal", "repeat"), k=3)
+
+    assert matches[0].post_id == "p1"
+    assert matches[0].minhash_similarity > 0.7
+    assert index.lookup("Completely different words that share no shingles at all with anything stored") == []
+
+
+def test_new_instance_loads_and_refresh_picks_up_other_writers(tmp_path):
+    writer = ContentIndex(str(tmp_path))
+    writer.add("p1", POST)
+    reader = ContentIndex(str(tmp_path))
+    assert len(reader) == 1
+
+    writer.add("p2", "A second post about loyalty programs for neighbourhood coffee shops and bakeries")
+    reader.refresh()
+
+    assert len(reader) == 2
+    assert reader.lookup("A second post about loyalty programs for neighbourhood coffee shops and bakeries")[0].post_id == "p2"
+
+
+def test_dedup_agent_skips_or_flags_duplicates(tmp_path):
+    index = ContentIndex(str(tmp_path))
+    index.add("p1", f"Spring campaign\n\n{POST}")
+    contents = AllMarketingContents(contents=[_content("1", POST), _content("2", "Fresh copy about a summer pop-up market downtown")])
+
+    kept, report = dedup_agent(contents, index, DedupPolicy())
+    assert [c.insight_id for c in kept.contents] == ["2"]
+    assert [d.action for d in report.decisions] == ["skipped", "kept"]
+
+    kept, report = dedup_agent(contents, index, DedupPolicy(action="flag"))
+    assert len(kept.contents) == 2
+    assert [d.action for d in report.decisions] == ["flagged", "kept"]
+
+
+def test_dedup_policy_rejects_unknown_actions():
+    with pytest.raises(ValidationError):
+        DedupPolicy(action="skipp")
+    assert DedupPolicy(**DedupPolicy(action="off").model_dump()).action == "off"
@@ -0,0 +1,94 @@
+import multiprocessing
+
+from agent.services.doc_store import DocStore, content_hash
+
+
+def _words(seed: int, n: int = 2000) -> str:
+    return " ".join(f"w{(seed * 7919 + i * 104729) % 100003}" for i in range(n))
+
+
+def test_put_and_get_text_roundtrip_and_dedup(tmp_path):
+    store = DocStore(str(tmp_path))
+    text = "hello world " * 500
+    key = store.put_text(text)
+
+    assert key == content_hash(text)
+    assert store.get_text(key) == text
+    size = store.disk_bytes()
+    assert store.put_text(text) == key
+    assert store.disk_bytes() == size
+    # Repetitive text is stored compressed
+    assert size < len(text.encode())
+
+
+def test_put_source_replaces_and_reads_back(tmp_path):
+    store = DocStore(str(tmp_path))
+    store.put_source("https://a.example/x", "web", "A", "raw a", "clean a", llm_cleaned=False)
+    stored = store.put_source("https://a.example/x", "web", "A", "raw a2", "clean a2")
+
+    got = store.get_source("https://a.example/x")
+    assert got.cleaned_hash == stored.cleaned_hash
+    assert got.llm_cleaned
+    assert store.get_text(got.raw_hash) == "raw a2"
+    assert [s.source for s in store.sources(kind="web")] == ["https://a.example/x"]
+    assert store.sources(kind="pdf") == []
+
+
+def test_compact_reclaims_dead_bytes_and_keeps_live_text(tmp_path):
+    store = DocStore(str(tmp_path), compress=False)
+    for i in range(10):
+        store.put_source(f"doc{i}", "web", f"t{i}", _words(i), _words(i + 100))
+    # Replacing half the sources leaves their old text unreferenced
+    for i in range(5):
+        store.put_source(f"doc{i}", "web", f"t{i}", _words(i + 200), _words(i + 300))
+    before = store.disk_bytes()
+
+    reclaimed = store.compact(dead_share=0.0)
+
+    assert reclaimed > 0
+    assert store.disk_bytes() == before - reclaimed == store.live_bytes()
+    for i in range(10):
+        source = store.get_source(f"doc{i}")
+        offset = 200 if i < 5 else 0
+        assert store.get_text(source.raw_hash) == _words(i + offset)
+
+
+def test_cap_evicts_least_recently_used_sources(tmp_path):
+    store = DocStore(str(tmp_path), compress=False)
+    per_source = len(_words(0).encode()) + len(_words(1000).encode())
+    store.max_bytes = int(per_source * 3.5)
+    store.put_source("old", "web", "old", _words(0), _words(1000))
+    store.put_source("used", "web", "used", _words(1), _words(1001))
+    store.put_source("mid", "web", "mid", _words(2), _words(1002))
+    store.get_source("used")
+
+    store.put_source("new", "web", "new", _words(3), _words(1003))
+
+    assert store.get_source("old") is None
+    assert store.get_source("used") is not None
+    assert store.get_source("new") is not None
+    assert store.disk_bytes() <= store.max_bytes
+
+
+def _append_many(path: str, worker: int) -> None:
+    store = DocStore(path, segment_bytes=64 * 1024)
+    for i in range(20):
+        store.put_source(f"w{worker}-{i}", "web", "t", _words(worker * 100 + i, 500), f"clean {worker} {i}")
+
+
+def test_concurrent_appends_from_processes(tmp_path):
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_append_many, args=(str(tmp_path), w)) for w in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert all(p.exitcode == 0 for p in procs)
+
+    store = DocStore(str(tmp_path))
+    assert len(store.sources()) == 80
+    for w in range(4):
+        for i in range(20):
+            source = store.get_source(f"w{w}-{i}")
+            assert store.get_text(source.raw_hash) == _words(w * 100 + i, 500)
+            assert store.get_text(source.cleaned_hash) == f"clean {w} {i}"
@@ -0,0 +1,150 @@
+import threading
+
+import pytest
+from chromadb.api.shared_system_client import SharedSystemClient
+from langchain_community.vectorstores.chroma import Chroma
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.tracers import context as tracer_context
+
+import agent.graph as graph
+import agent.services.rag_agent as rag_agent
+from agent.benchmark import HashingEmbeddings
+from agent.services.content_generation import AllMarketingContents
+from agent.services.local_doc_load import AllLocalDocResults, LocalDocResult
+from agent.services.search_agent import AllSearchResults, SearchResult
+from agent.services.search_doc_load import AllSearchDocResults, SearchDocResult
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    """Replace the external services of the graph; indexing and retrieval run on a real Chroma store."""
+    monkeypatch.setattr(rag_agent, "_embed_model", lambda model: HashingEmbeddings())
+    monkeypatch.setattr(graph, "google_search", lambda query: AllSearchResults(results=[
+        SearchResult(query=query, link=f"https://{host}.example/a", title=host, source=host, snippet="")
+        for host in ("alpha", "beta")
+    ]))
+    monkeypatch.setattr(graph, "retrieve_agent", _retrieve_all)
+    monkeypatch.setattr(graph, "insights_agent", graph.chunk_insights)
+    monkeypatch.setattr(graph, "marketing_content_agent", lambda insights: AllMarketingContents(contents=[]))
+    yield
+    SharedSystemClient.clear_system_cache()
+
+
+def _retrieve_all(query, db_path):
+    """Everything indexed so far, so tests see what both branches embedded before rag ran."""
+    store = Chroma(collection_name=rag_agent.COLLECTION_NAME, persist_directory=db_path)
+    return rag_agent.RagResult(content=store._collection.get()["documents"])
+
+
+def _state(tmp_path, **overrides):
+    state = graph.build_initial_state(
+        "quarterly marketing trends",
+        local_pdf_path="report.pdf",
+        db_path=str(tmp_path / "chroma"),
+        doc_store_path=None,
+        skip_publishing=True,
+        skip_analytics=True,
+    )
+    state.update(overrides)
+    return state
+
+
+def test_loaders_run_concurrently_and_rag_joins_both(tmp_path, monkeypatch, offline):
+    local_started = threading.Event()
+    overlapped = []
+
+    def web_loader(results, on_document, **kwargs):
+        # Only returns promptly if local_loader runs at the same time
+        overlapped.append(local_started.wait(timeout=5))
+        docs = AllSearchDocResults()
+        for r in results.results:
+            doc = SearchDocResult(title=r.title, content=f"{r.title} web page on marketing trends")
+            on_document(doc)
+            docs.results.append(doc)
+        return docs
+
+    def pdf_loader(path, store=None):
+        local_started.set()
+        return AllLocalDocResults(results=[LocalDocResult(title=path, content="annual report on marketing trends")])
+
+    monkeypatch.setattr(graph, "text_loader", web_loader)
+    monkeypatch.setattr(graph, "extract_text_from_pdf", pdf_loader)
+
+    final = graph.create_graph().invoke(_state(tmp_path))
+
+    assert overlapped == [True]
+    # rag joined both branches: every document was embedded before it queried
+    assert len(final["rag_results"].content) == 3
+    assert len(final["web_documents"].results) == 2
+    assert len(final["local_documents"].results) == 1
+    assert final["errors"] == []
+
+
+def test_failed_branch_does_not_block_the_other(tmp_path, monkeypatch, offline):
+    def web_loader(results, on_document, **kwargs):
+        raise RuntimeError("crawler down")
+
+    monkeypatch.setattr(graph, "text_loader", web_loader)
+    monkeypatch.setattr(graph, "extract_text_from_pdf", lambda path, store=None: AllLocalDocResults(
+        results=[LocalDocResult(title=path, content="annual report on marketing trends")]
+    ))
+
+    final = graph.create_graph().invoke(_state(tmp_path))
+
+    assert final["web_documents"].results == []
+    assert final["errors"] == ["Web loader error: crawler down"]
+    assert final["rag_results"].content == ["annual report on marketing trends"]
+    assert final["strategic_insights"] is not None
+
+
+@pytest.mark.parametrize("deadline_seconds, reserve", [(20, 8.0), (1000, 90.0)])
+def test_crawl_stops_before_the_synthesis_reserve_of_the_run(tmp_path, monkeypatch, offline, deadline_seconds, reserve):
+    stops = []
+
+    def web_loader(results, on_document, stop_at=None, **kwargs):
+        stops.append(stop_at)
+        return AllSearchDocResults()
+
+    monkeypatch.setattr(graph, "text_loader", web_loader)
+    state = graph.build_initial_state(
+        "q", db_path=str(tmp_path / "chroma"), doc_store_path=None, skip_publishing=True,
+        skip_analytics=True, deadline_seconds=deadline_seconds
+    )
+
+    graph.create_graph().invoke(state)
+
+    # The web research subgraph must see when the run started, or a short deadline leaves no time to crawl
+    assert state["deadline"] - stops[0] == pytest.approx(reserve)
+
+
+def test_budget_counts_node_tokens_and_reports_degradations(tmp_path, monkeypatch, offline):
+    reply = AIMessage(
+        content="cleaned page",
+        usage_metadata={"input_tokens": 8, "output_tokens": 4, "total_tokens": 12},
+        response_metadata={"model_name": "test-model"},
+    )
+    cleanup_llm = GenericFakeChatModel(messages=iter([reply] * 2))
+    limits = []
+
+    def web_loader(results, on_document, cleanup_token_limit=None, **kwargs):
+        limits.append(cleanup_token_limit)
+        docs = AllSearchDocResults()
+        # Cleans the first page only, as if the deadline passed before the second
+        doc = SearchDocResult(title="alpha", content=cleanup_llm.invoke("raw page").content)
+        on_document(doc)
+        docs.results.append(doc)
+        return docs
+
+    monkeypatch.setattr(graph, "text_loader", web_loader)
+    hooks = len(tracer_context._configure_hooks)
+
+    final = graph.create_graph().invoke(_state(tmp_path, local_pdf_path=None, skip_local_docs=True, token_budget=5000))
+
+    assert limits == [2000]
+    assert final["tokens_used"] == 12
+    assert "web_loader: crawled 1/2 links before the deadline" in final["degradations"]
+    # Under TWO_STAGE_MIN_TOKENS insights come straight from the retrieved chunks
+    assert any(d.startswith("insights: skipped LLM synthesis") for d in final["degradations"])
+    assert final["strategic_insights"].insights[0].insight_id == "chunk-1"
+    assert len(tracer_context._configure_hooks) == hooks
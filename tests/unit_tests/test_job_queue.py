@@ -0,0 +1,116 @@
+import json
+import sqlite3
+import time
+
+from agent.job_queue import JobQueue, JobRequest, TenantConfig, tenant_access_token
+
+
+def _queue(tmp_path, tenants=("a", "b")) -> JobQueue:
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    for tenant in tenants:
+        queue.add_tenant(TenantConfig(tenant_id=tenant, db_path=str(tmp_path)))
+    return queue
+
+
+def test_claims_alternate_between_tenants(tmp_path):
+    queue = _queue(tmp_path)
+    a_jobs = [queue.submit("a", JobRequest(query=f"a{i}")) for i in range(3)]
+    b_jobs = [queue.submit("b", JobRequest(query=f"b{i}")) for i in range(2)]
+
+    claimed = [queue.claim_next("w1") for _ in range(5)]
+
+    tenants = [queue.status(job_id).tenant_id for job_id in claimed]
+    # A tenant with a running job waits behind one without, so a busy brand cannot starve the others
+    assert tenants[:4] in (["a", "b", "a", "b"], ["b", "a", "b", "a"])
+    assert set(claimed) == set(a_jobs + b_jobs)
+    assert queue.claim_next("w1") is None
+
+
+def test_claim_records_worker_and_lease(tmp_path):
+    queue = _queue(tmp_path)
+    job_id = queue.submit("a", JobRequest(query="q"))
+
+    assert queue.claim_next("host:1") == job_id
+    status = queue.status(job_id)
+    assert status.status == "running"
+    assert status.worker_id == "host:1"
+    assert status.heartbeat_at is not None
+
+
+def test_requeue_only_takes_expired_leases(tmp_path):
+    queue = _queue(tmp_path)
+    live = queue.submit("a", JobRequest(query="live"))
+    stale = queue.submit("b", JobRequest(query="stale"))
+    queue.claim_next("w1")
+    queue.claim_next("w1")
+    with sqlite3.connect(queue.path) as conn:
+        conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE job_id = ?", (time.time() - 3600, stale))
+    queue.heartbeat(live)
+
+    assert queue.requeue_stale(lease_seconds=60) == 1
+    assert queue.status(live).status == "running"
+    assert queue.status(stale).status == "queued"
+    assert queue.status(stale).worker_id is None
+
+
+def test_finish_and_fail_record_result(tmp_path):
+    queue = _queue(tmp_path)
+    done = queue.submit("a", JobRequest(query="done"))
+    failed = queue.submit("a", JobRequest(query="failed"))
+
+    queue.finish(done, {"k": 1}, ["warning"])
+    queue.fail(failed, "boom", result={"k": 2})
+
+    assert queue.status(done).status == "succeeded"
+    assert queue.status(done).result == {"k": 1}
+    assert queue.status(failed).status == "failed"
+    assert queue.status(failed).errors == ["boom"]
+    assert queue.status(failed).result == {"k": 2}
+
+
+def test_opens_queue_created_before_leases(tmp_path):
+    path = str(tmp_path / "old.sqlite")
+    with sqlite3.connect(path) as conn:
+        conn.executescript("""
+            CREATE TABLE tenants (tenant_id TEXT PRIMARY KEY, config TEXT NOT NULL, last_claimed_at REAL NOT NULL DEFAULT 0);
+            CREATE TABLE jobs (
+                job_id TEXT PRIMARY KEY, tenant_id TEXT NOT NULL, request TEXT NOT NULL, status TEXT NOT NULL,
+                current_node TEXT, completed_nodes TEXT NOT NULL DEFAULT '[]', errors TEXT NOT NULL DEFAULT '[]',
+                created_at REAL NOT NULL, started_at REAL, finished_at REAL, result TEXT
+            );
+        """)
+
+    queue = JobQueue(path)
+    queue.add_tenant(TenantConfig(tenant_id="a", db_path=str(tmp_path)))
+    job_id = queue.submit("a", JobRequest(query="q"))
+    assert queue.claim_next("w1") == job_id
+
+
+def test_tenant_token_is_read_from_the_environment_not_the_queue(tmp_path, monkeypatch):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    queue.add_tenant(TenantConfig(tenant_id="a", db_path=str(tmp_path), facebook_access_token_env="BRAND_A_TOKEN"))
+    monkeypatch.setenv("BRAND_A_TOKEN", "secret-token")
+
+    assert tenant_access_token(queue.get_tenant("a")) == "secret-token"
+    with sqlite3.connect(queue.path) as conn:
+        assert not any("secret-token" in row[0] for row in conn.execute("SELECT config FROM tenants"))
+
+    monkeypatch.delenv("BRAND_A_TOKEN")
+    assert tenant_access_token(queue.get_tenant("a")) is None
+    assert tenant_access_token(TenantConfig(tenant_id="b", db_path=str(tmp_path))) is None
+
+
+def test_opening_the_queue_drops_tokens_stored_by_older_versions(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    JobQueue(path)
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "INSERT INTO tenants (tenant_id, config) VALUES (?, ?)",
+            ("a", json.dumps({"tenant_id": "a", "db_path": str(tmp_path), "facebook_access_token": "secret-token"}))
+        )
+
+    queue = JobQueue(path)
+
+    with sqlite3.connect(path) as conn:
+        assert "secret-token" not in conn.execute("SELECT config FROM tenants").fetchone()[0]
+    assert queue.get_tenant("a").db_path == str(tmp_path)
@@ -0,0 +1,166 @@
+import threading
+import time
+
+import pytest
+
+from agent.services import resilience
+from agent.services.resilience import (
+    CircuitOpenError,
+    DeadlineExceeded,
+    ServiceGuard,
+    ServicePolicy,
+    call_deadline,
+    call_timeout,
+    get_guard,
+)
+
+
+class FakeHTTPError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _guard(**overrides):
+    policy = ServicePolicy(max_concurrency=4, rate_per_second=1000.0, burst=100, **overrides)
+    return ServiceGuard("test", policy)
+
+
+def _flaky(*errors, result="ok"):
+    """Raise each of errors in turn, then return result; records every call."""
+    calls = []
+
+    def fn():
+        calls.append(time.monotonic())
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return fn, calls
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience.random, "uniform", lambda a, b: 0.0)
+
+
+def test_retries_transient_errors_then_succeeds():
+    fn, calls = _flaky(FakeHTTPError(503), ConnectionError("reset"))
+
+    assert _guard(max_retries=2).call(fn) == "ok"
+    assert len(calls) == 3
+
+
+def test_gives_up_after_max_retries():
+    fn, calls = _flaky(*[FakeHTTPError(502)] * 5)
+
+    with pytest.raises(FakeHTTPError):
+        _guard(max_retries=2).call(fn)
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize("status, attempts", [(400, 1), (404, 1), (408, 2), (429, 2)])
+def test_client_errors_are_not_retried_except_timeouts_and_rate_limits(status, attempts):
+    fn, calls = _flaky(FakeHTTPError(status))
+    guard = _guard(max_retries=1)
+
+    if attempts == 1:
+        with pytest.raises(FakeHTTPError):
+            guard.call(fn)
+    else:
+        assert guard.call(fn) == "ok"
+    assert len(calls) == attempts
+    assert guard.breaker.state == "closed"
+
+
+def test_breaker_opens_after_consecutive_failures_and_recovers_after_reset():
+    guard = _guard(max_retries=0, failure_threshold=2, reset_timeout=0.2)
+    fn, calls = _flaky(FakeHTTPError(500), FakeHTTPError(500))
+
+    for _ in range(2):
+        with pytest.raises(FakeHTTPError):
+            guard.call(fn)
+    with pytest.raises(CircuitOpenError):
+        guard.call(fn)
+    assert len(calls) == 2
+
+    time.sleep(0.25)
+    # The half-open trial call succeeds and closes the circuit
+    assert guard.call(fn) == "ok"
+    assert guard.breaker.state == "closed"
+
+
+def test_failed_trial_call_reopens_the_circuit():
+    guard = _guard(max_retries=0, failure_threshold=1, reset_timeout=0.1)
+    fn, calls = _flaky(FakeHTTPError(500), FakeHTTPError(500))
+
+    with pytest.raises(FakeHTTPError):
+        guard.call(fn)
+    time.sleep(0.15)
+    with pytest.raises(FakeHTTPError):
+        guard.call(fn)
+    with pytest.raises(CircuitOpenError):
+        guard.call(fn)
+    assert len(calls) == 2
+
+
+def test_hedged_request_returns_the_first_reply():
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            # The first request stalls until the test ends
+            release.wait(timeout=5)
+            return "slow"
+        return "fast"
+
+    start = time.monotonic()
+    try:
+        assert _guard(hedge_after=0.1).call(fn) == "fast"
+    finally:
+        release.set()
+    assert len(calls) == 2
+    assert time.monotonic() - start < 2
+
+
+def test_deadline_cuts_a_slow_call_short_and_skips_calls_after_it():
+    guard = _guard(max_retries=3)
+    fn, calls = _flaky()
+
+    start = time.monotonic()
+    with call_deadline(time.time() + 0.3), pytest.raises(DeadlineExceeded):
+        guard.call(lambda: time.sleep(3))
+    assert time.monotonic() - start < 1.5
+
+    with call_deadline(time.time() - 1), pytest.raises(DeadlineExceeded):
+        guard.call(fn)
+    assert calls == []
+
+
+def test_no_retry_when_the_backoff_would_pass_the_deadline(monkeypatch):
+    monkeypatch.setattr(resilience.random, "uniform", lambda a, b: 5.0)
+    fn, calls = _flaky(FakeHTTPError(503))
+
+    with call_deadline(time.time() + 1), pytest.raises(FakeHTTPError):
+        _guard(max_retries=3).call(fn)
+    assert len(calls) == 1
+
+
+def test_call_timeout_is_capped_by_the_deadline():
+    assert call_timeout("web:example.com") == resilience.SERVICE_POLICIES["web"].timeout
+    with call_deadline(time.time() + 2):
+        assert call_timeout("web") <= 2
+
+
+def test_each_host_gets_its_own_breaker():
+    a, b = get_guard("web:a.example"), get_guard("web:b.example")
+
+    assert a is get_guard("web:a.example")
+    assert a is not b
+    assert a.policy == resilience.SERVICE_POLICIES["web"]
+    for _ in range(a.policy.failure_threshold):
+        a.breaker.record_failure()
+    assert a.breaker.state == "open"
+    assert b.breaker.state == "closed"
@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+import agent.graph
+from agent.review_queue import ReviewQueue, main
+from agent.services.content_schema import AllMarketingContents, MarketingContent
+
+
+def _contents() -> AllMarketingContents:
+    return AllMarketingContents(contents=[MarketingContent(
+        insight_id="1", content_format="Poster", headline="h", body_text="b", call_to_action="c",
+        target_audience="a", distribution_channel=["Facebook"], sources=[]
+    )])
+
+
+def test_decided_reviews_are_claimed_once_in_decision_order(tmp_path):
+    queue = ReviewQueue(str(tmp_path / "reviews.sqlite"))
+    first = queue.submit("q1", _contents(), {"db_path": "x"})
+    second = queue.submit("q2", _contents(), {"db_path": "x"})
+    queue.decide(second, approved=False, feedback="no")
+    queue.decide(first, approved=True)
+
+    rejected = queue.claim_decided()
+    approved = queue.claim_decided()
+
+    assert (rejected.review_id, rejected.status) == (second, "rejected")
+    assert (approved.review_id, approved.status) == (first, "approved")
+    assert queue.get(second).status == "closed"
+    assert queue.get(first).status == "publishing"
+    assert queue.claim_decided() is None
+    with pytest.raises(ValueError):
+        queue.decide(first, approved=True)
+
+
+def test_failed_review_can_be_retried(tmp_path):
+    queue = ReviewQueue(str(tmp_path / "reviews.sqlite"))
+    review_id = queue.submit("q", _contents(), {"db_path": "x"})
+    queue.decide(review_id, approved=True)
+    assert queue.claim(review_id)
+    assert not queue.claim(review_id)
+
+    queue.finish(review_id, "failed")
+    assert queue.retry(review_id).status == "approved"
+    assert queue.claim(review_id)
+
+
+def test_requeue_only_takes_expired_publishing_leases(tmp_path):
+    queue = ReviewQueue(str(tmp_path / "reviews.sqlite"))
+    live, stale = (queue.submit(q, _contents(), {"db_path": "x"}) for q in ("live", "stale"))
+    for review_id in (live, stale):
+        queue.decide(review_id, approved=True)
+        assert queue.claim(review_id)
+    with sqlite3.connect(queue.path) as conn:
+        conn.execute("UPDATE reviews SET heartbeat_at = ? WHERE review_id = ?", (time.time() - 3600, stale))
+
+    assert queue.requeue_stale(lease_seconds=60) == 1
+    assert queue.get(live).status == "publishing"
+    assert queue.get(stale).status == "approved"
+
+
+def _run_cli(monkeypatch, queue, *args):
+    monkeypatch.setattr(sys, "argv", ["review_queue", "--queue", queue.path, *args])
+    main()
+
+
+@pytest.fixture
+def published(monkeypatch):
+    """Replace resume_review, recording the review status and token it was called with."""
+    calls = []
+
+    def resume_review(review_id, review_queue_path, facebook_access_token=None):
+        calls.append((ReviewQueue(review_queue_path).get(review_id).status, facebook_access_token))
+
+    monkeypatch.setattr(agent.graph, "resume_review", resume_review)
+    return calls
+
+
+def test_publish_now_requires_a_token(tmp_path, monkeypatch, published):
+    queue = ReviewQueue(str(tmp_path / "reviews.sqlite"))
+    review_id = queue.submit("q", _contents(), {"db_path": "x"})
+
+    with pytest.raises(SystemExit) as exc:
+        _run_cli(monkeypatch, queue, "approve", review_id, "--publish-now")
+    assert exc.value.code == 2
+    assert queue.get(review_id).status == "pending"
+
+    _run_cli(monkeypatch, queue, "approve", review_id, "--publish-now", "--facebook-access-token", "t")
+    assert published == [("publishing", "t")]
+
+
+def test_retried_review_is_published_with_the_publish_command(tmp_path, monkeypatch, published):
+    queue = ReviewQueue(str(tmp_path / "reviews.sqlite"))
+    review_id = queue.submit("q", _contents(), {"db_path": "x"})
+    queue.decide(review_id, approved=True)
+    assert queue.claim(review_id)
+    queue.finish(review_id, "failed")
+
+    _run_cli(monkeypatch, queue, "retry", review_id)
+    _run_cli(monkeypatch, queue, "publish", review_id, "--facebook-access-token", "t")
+
+    assert published == [("publishing", "t")]
+
+
+def test_publish_refuses_reviews_that_are_not_approved(tmp_path, monkeypatch, published):
+    queue = ReviewQueue(str(tmp_path / "reviews.sqlite"))
+    review_id = queue.submit("q", _contents(), {"db_path": "x"})
+
+    with pytest.raises(SystemExit, match="status: pending"):
+        _run_cli(monkeypatch, queue, "publish", review_id, "--facebook-access-token", "t")
+    with pytest.raises(SystemExit):
+        _run_cli(monkeypatch, queue, "publish", review_id)
+    assert published == []
+    assert queue.get(review_id).status == "pending"
+
+
+@pytest.mark.parametrize("args", [["agent.review_queue", "list"], ["agent.worker", "status"]])
+def test_queue_commands_run_without_openai_credentials(tmp_path, args):
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    env["PYTHONPATH"] = os.pathsep.join(sys.path)
+    module, command = args
+    # Run outside the repo so no .env file supplies a key
+    proc = subprocess.run(
+        [sys.executable, "-m", module, "--queue", str(tmp_path / "jobs.sqlite"), command],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert proc.returncode == 0, proc.stderr
@@ -0,0 +1,143 @@
+from typing import List
+
+import pytest
+from langchain_core.callbacks import UsageMetadataCallbackHandler
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tracers import context as tracer_context
+from pydantic import BaseModel
+
+from llm_model import StructuredLLM, collect_structured_stats, merge_structured_stats, usage_config
+
+PROMPT = ChatPromptTemplate.from_template("Give me items about {topic}")
+
+
+class Item(BaseModel):
+    item_id: str
+    text: str
+
+
+class Items(BaseModel):
+    items: List[Item]
+
+
+def _llm(*replies, prompts=None) -> StructuredLLM:
+    llm = StructuredLLM(Items, "test-model", 0.0)
+    queue = list(replies)
+
+    def reply(prompt_value):
+        if prompts is not None:
+            prompts.append(prompt_value.to_string())
+        return queue.pop(0)
+
+    llm._llm = RunnableLambda(reply)
+    return llm
+
+
+def _raw(content: str) -> dict:
+    return {"parsed": None, "raw": AIMessage(content=content), "parsing_error": ValueError("invalid")}
+
+
+def _parsed(*ids: str) -> dict:
+    return {"parsed": Items(items=[Item(item_id=i, text=i) for i in ids]), "raw": AIMessage(content=""), "parsing_error": None}
+
+
+def test_fast_path_needs_no_repair():
+    with collect_structured_stats() as stats:
+        out = _llm(_parsed("1", "2")).invoke(PROMPT, {"topic": "x"}, min_items=2, id_field="item_id")
+
+    assert [i.item_id for i in out.items] == ["1", "2"]
+    assert stats["test-model"].fast_path == 1
+    assert stats["test-model"].repair_requests == 0
+
+
+def test_keeps_valid_items_and_repairs_only_missing_ones():
+    first = _raw('{"items": [{"item_id": "1", "text": "a"}, {"item_id": "2"}]}')
+    with collect_structured_stats() as stats:
+        out = _llm(first, _parsed("2")).invoke(
+            PROMPT, {"topic": "x"}, id_field="item_id", expected_ids=["1", "2"]
+        )
+
+    assert [(i.item_id, i.text) for i in out.items] == [("1", "a"), ("2", "2")]
+    assert stats["test-model"].invalid_items == 1
+    assert stats["test-model"].repair_requests == 1
+    assert stats["test-model"].repaired_items == 1
+    assert stats["test-model"].failure_rate == 1.0
+
+
+def test_truncated_json_is_parsed_partially():
+    truncated = _raw('{"items": [{"item_id": "1", "text": "a"}, {"item_id": "2", "te')
+    out = _llm(truncated, _parsed("3")).invoke(PROMPT, {"topic": "x"}, min_items=2, id_field="item_id")
+
+    assert [i.item_id for i in out.items] == ["1", "3"]
+
+
+def test_returns_partial_result_after_last_repair():
+    with collect_structured_stats() as stats:
+        out = _llm(_parsed("1"), _parsed("1"), _raw("not json")).invoke(
+            PROMPT, {"topic": "x"}, id_field="item_id", expected_ids=["1", "2"]
+        )
+
+    assert [i.item_id for i in out.items] == ["1"]
+    assert stats["test-model"].failed_calls == 1
+    assert stats["test-model"].repair_requests == 2
+
+
+def test_raises_when_nothing_valid():
+    with pytest.raises(ValueError, match="No valid items"):
+        _llm(_raw("no"), _raw("still no"), _raw("")).invoke(PROMPT, {"topic": "x"})
+
+
+def test_merge_structured_stats_sums_by_model():
+    with collect_structured_stats() as first:
+        _llm(_parsed("1")).invoke(PROMPT, {"topic": "x"})
+    with collect_structured_stats() as second:
+        _llm(_parsed("1")).invoke(PROMPT, {"topic": "x"})
+
+    merged = merge_structured_stats(first, second)
+    assert merged["test-model"].calls == 2
+    assert first["test-model"].calls == 1
+
+
+def test_repair_shows_accepted_items_and_keeps_only_what_was_asked_for():
+    prompts = []
+    first = _raw('{"items": [{"item_id": "1", "text": "first insight"}, {"item_id": "2"}]}')
+    out = _llm(first, _parsed("1", "3", "4", "5"), prompts=prompts).invoke(
+        PROMPT, {"topic": "x"}, min_items=2, id_field="item_id"
+    )
+
+    # The repair saw what was already accepted, and the repeated "1" did not count towards the one missing item
+    assert "first insight" in prompts[1]
+    assert [i.item_id for i in out.items] == ["1", "3"]
+
+
+def test_unkeyed_repair_is_capped_at_the_missing_count():
+    out = _llm(_parsed("1"), _parsed("2", "3", "4")).invoke(PROMPT, {"topic": "x"}, min_items=2)
+
+    assert [i.item_id for i in out.items] == ["1", "2"]
+
+
+def test_counts_tokens_per_request_without_global_hooks():
+    reply = AIMessage(
+        content='{"items": [{"item_id": "1", "text": "a"}]}',
+        usage_metadata={"input_tokens": 7, "output_tokens": 5, "total_tokens": 12},
+        response_metadata={"model_name": "test-model"},
+    )
+    llm = StructuredLLM(Items, "test-model", 0.0)
+    llm._llm = GenericFakeChatModel(messages=iter([reply] * 3)) | RunnableLambda(
+        lambda message: {"parsed": None, "raw": message, "parsing_error": None}
+    )
+    hooks = len(tracer_context._configure_hooks)
+    outer = UsageMetadataCallbackHandler()
+
+    with collect_structured_stats() as stats:
+        RunnableLambda(lambda _: [llm.invoke(PROMPT, {"topic": "x"}) for _ in range(3)]).invoke(
+            None, config=usage_config(outer)
+        )
+
+    assert stats["test-model"].tokens == 36
+    # Callbacks of the caller still see the requests
+    assert outer.usage_metadata["test-model"]["total_tokens"] == 36
+    assert len(tracer_context._configure_hooks) == hooks
@@ -0,0 +1,40 @@
+import pytest
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import RunnableLambda
+
+import llm_model
+from agent.services import resilience
+
+
+class FakeEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [[1.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0]
+
+
+@pytest.fixture
+def original_policies():
+    policies = dict(resilience.SERVICE_POLICIES)
+    yield policies
+    resilience.SERVICE_POLICIES.update(policies)
+    resilience._guards.clear()
+
+
+def test_clients_built_before_share_limits_use_the_shared_limits(original_policies, monkeypatch):
+    # Module-level clients are built when the dispatcher imports the services, before the pool runs share_limits
+    chat = llm_model._guard_runnable(RunnableLambda(lambda x: x))
+    embeddings = llm_model._GuardedEmbeddings(FakeEmbeddings())
+
+    resilience.share_limits(4)
+    used = []
+    for service in ("openai_chat", "openai_embedding"):
+        guard = resilience.get_guard(service)
+        monkeypatch.setattr(guard, "call", lambda fn, *args, _guard=guard: used.append(_guard) or fn(*args))
+
+    assert chat.invoke("hi") == "hi"
+    assert embeddings.embed_query("hi") == [1.0]
+    assert [guard.name for guard in used] == ["openai_chat", "openai_embedding"]
+    for guard in used:
+        assert guard.policy.rate_per_second == original_policies[guard.name].rate_per_second / 4